@@ -1,12 +1,10 @@
 # %%
 import sys
 import numpy as np
-import pandas as pd
 from datetime import datetime
 from dataclasses import dataclass, asdict, field
 
 from cointracker.settings.config import fiat_currencies
-import yaml
 
 
 dataclass_kw = {"frozen": True, "order": True}
@@ -20,6 +18,7 @@ class Asset:
     ticker: str  # typically 3-4 characters
     fungible: bool  # fungible/non-fungible
     decimals: int = None  # smallest decimal permitted. Ex: USD = 2 for $0.01 or 1 cent
+    _is_fiat: bool = field(default=None, init=False, repr=False, compare=False)  # set once registered
 
     def __post_init__(self):
         if not self.fungible:  # non-fungible tokens have no sub-units
@@ -35,9 +34,10 @@ class Asset:
 
     @property
     def is_fiat(self) -> bool:
-        return is_asset_fiat(
-            self.ticker
-        )  # TODO: creates circular reference if fiat currencies are imported from an AssetRegistry?
+        """Whether the asset is a known fiat currency, fixed when the asset is registered (or first asked otherwise)."""
+        if self._is_fiat is None:
+            object.__setattr__(self, "_is_fiat", is_asset_fiat(self.ticker))
+        return self._is_fiat
 
     def is_asset(self, string: str) -> bool:
         """Returns true if the input string matches the `Asset` name or ticker."""
@@ -46,7 +46,9 @@ class Asset:
         return is_name | is_ticker
 
     def to_dict(self):
-        return asdict(self)
+        dictionary = asdict(self)
+        dictionary.pop("_is_fiat")
+        return dictionary
 
 
 @dataclass
@@ -54,8 +56,53 @@ class AssetRegistry:
     assets: list[Asset] = field(
         default_factory=list, repr=False
     )  # TODO: consider refactoring using sets instead of lists
+    _index: dict[str, Asset] = field(default=None, init=False, repr=False, compare=False)
+    _indexed: int = field(default=0, init=False, repr=False, compare=False)  # len(assets) when indexed
+
+    def __post_init__(self):
+        self._reindex()
+
+    def _reindex(self):
+        """Indexes the assets by upper case name and ticker, later assets winning, and fixes the fiat flags of those
+        not registered before.
+        """
+        index = {}
+        for asset in self.assets:
+            index[asset.name.upper()] = asset
+            index[asset.ticker.upper()] = asset
+        unflagged = [asset for asset in self.assets if asset._is_fiat is None]
+        if len(unflagged) > 0:
+            fiat = fiat_currencies()
+            for asset in unflagged:
+                object.__setattr__(asset, "_is_fiat", asset.ticker.upper() in fiat)
+        self._index = index
+        self._indexed = len(self.assets)
+
+    def refresh_fiat(self):
+        """Flags every asset against the fiat currencies configured now, e.g. after unpickling ones flagged earlier."""
+        fiat = fiat_currencies()
+        for asset in self.assets:
+            object.__setattr__(asset, "_is_fiat", asset.ticker.upper() in fiat)
+
+    def copy(self):
+        """Returns a registry of the same assets that can be added to without changing this one."""
+        registry = AssetRegistry.__new__(AssetRegistry)
+        registry.assets = list(self.assets)
+        registry._index = dict(self._index)
+        registry._indexed = self._indexed
+        return registry
+
+    def append(self, asset: Asset):
+        """Registers `asset`, see `_reindex`."""
+        self.assets.append(asset)
+        self._index[asset.name.upper()] = asset
+        self._index[asset.ticker.upper()] = asset
+        object.__setattr__(asset, "_is_fiat", is_asset_fiat(asset.ticker))
+        self._indexed = len(self.assets)
 
     def to_yaml(self, filename):
+        import yaml
+
         registry = {}
         for asset in self.assets:
             registry[asset.ticker] = asset.to_dict()
@@ -82,8 +129,8 @@ class AssetRegistry:
             combined_assets = [*self.assets, *item.assets]
             return AssetRegistry(combined_assets)
         if isinstance(item, list):
-            all_asset = [isinstance(i, Asset) for i in item].all()
-            all_str = [isinstance(i, str) for i in item].all()
+            all_asset = all(isinstance(i, Asset) for i in item)
+            all_str = all(isinstance(i, str) for i in item)
             assert (
                 all_asset or all_str
             ), f"Assets appending to `AssetRegistry` must be all be of `Asset` or `str` type"
@@ -103,6 +150,13 @@ class AssetRegistry:
     def __iter__(self):
         return self.assets.__iter__()
 
+    def __contains__(self, item) -> bool:
+        if isinstance(item, str):
+            if self._indexed != len(self.assets):
+                self._reindex()
+            return item.upper() in self._index
+        return item in self.assets
+
     def __next__(self):
         return self.assets.__next__()
 
@@ -113,13 +167,9 @@ class AssetRegistry:
         elif isinstance(key, (int, np.integer)):
             return self.assets[key]
         elif isinstance(key, str):
-            asset = None
-            for asset_in_registry in self:
-                if (
-                    asset_in_registry.name.upper() == key.upper()
-                    or asset_in_registry.ticker.upper() == key.upper()
-                ):
-                    asset = asset_in_registry
+            if self._indexed != len(self.assets):  # `assets` was changed directly
+                self._reindex()
+            asset = self._index.get(key.upper())
             if asset is None:
                 raise ValueError(f"{key} not found in `AssetRegistry`")
             else:
@@ -135,6 +185,7 @@ class AssetRegistry:
             self.assets[key] = value
         else:
             raise TypeError(f"Invalid argument type: {type(key)}")
+        self._reindex()  # a replaced asset may still be indexed by an earlier one's key
 
     @property
     def nft(self):
@@ -163,6 +214,8 @@ def asset_from_dict(dictionary):
 
 
 def import_registry(filename):
+    import yaml
+
     with open(filename, "r") as file:
         registry = yaml.safe_load(file)
 
@@ -14,3 +14,9 @@ class IncorrectPoolFormat(BaseException):
     def __init__(self, message):
         # Call the base class constructor with the parameters it needs
         super().__init__(message)
+
+
+class UnlistedAssetError(LookupError):
+    def __init__(self, message):
+        # Call the base class constructor with the parameters it needs
+        super().__init__(message)
@@ -1,7 +1,6 @@
 # %%
 import sys
 import numpy as np
-import pandas as pd
 from itertools import count
 from datetime import datetime
 from dataclasses import dataclass, field
@@ -156,6 +155,8 @@ class Order:
 
     def to_series(self):
         """Returns the object as a pandas series"""
+        import pandas as pd
+
         series = {
             "Date(UTC)": self.date,
             "Market": self.market,
@@ -256,6 +257,8 @@ class OrderBook:
         """Converts the `OrderBook` object into a pandas DataFrame. Sorts orders by ascending date if `ascending=True`,
         descending date if `ascending=False` or does not change the ordering indicies if `ascending=None`.
         """
+        import pandas as pd
+
         df = pd.DataFrame([order.to_series() for order in self])
         if ascending is not None:
             df.sort_values(
@@ -317,6 +320,8 @@ class Transaction:
 
     def to_series(self):
         """Returns the object as a pandas series"""
+        import pandas as pd
+
         series = {
             "ID": self.id,
             "Date(UTC)": self.date,
@@ -1,10 +1,13 @@
 # %%
 import numpy as np
-import pandas as pd
+import bisect
 import datetime
+import heapq
 import uuid
+from itertools import count
 from dataclasses import dataclass, field
 from cointracker.objects.asset import Asset
+from cointracker.objects.enumerated_values import OrderingStrategy
 
 WASH_WINDOW = datetime.timedelta(days=31)
 VARIOUS_DATES_MICROSECOND = 123456
@@ -147,11 +150,11 @@ class Pool:
 
     def set_dtypes(self):
         self.amount = float(self.amount)
-        self.purchase_date = self.purchase_date.replace(tzinfo=datetime.timezone.utc)
+        self.purchase_date = as_utc(self.purchase_date)
         self.purchase_cost_fiat = np.round(self.purchase_cost_fiat, decimals=2)
         self.purchase_fee_fiat = np.round(self.purchase_fee_fiat, decimals=2)
         if self.sale_date is not None:
-            self.sale_date = self.sale_date.replace(tzinfo=datetime.timezone.utc)
+            self.sale_date = as_utc(self.sale_date)
             self.sale_value_fiat = np.round(self.sale_value_fiat, decimals=2)
             self.sale_fee_fiat = np.round(self.sale_fee_fiat, decimals=2)
             self.wash.disallowed_loss_fiat = np.round(
@@ -162,6 +165,8 @@ class Pool:
             )
 
     def to_series(self):
+        import pandas as pd
+
         return pd.Series(self.to_dict())
 
     def to_dict(self) -> dict:
@@ -228,9 +233,147 @@ class Pool:
             )
 
 
+class OpenLotIndex:
+    """Per-ticker heaps of open pools ordered by purchase date, one for FIFO and one for LIFO selection. Ties in purchase
+    date are broken by the order in which pools were indexed. Pools that have closed are dropped lazily the next time they
+    reach the top of a heap.
+    """
+
+    def __init__(self, pools: list[Pool]):
+        self.pools = pools
+        self.size = 0
+        self._sequence = count()
+        self._fifo = {}
+        self._lifo = {}
+        for pool in pools:
+            self.push(pool, heapify=False)
+        for heap in [*self._fifo.values(), *self._lifo.values()]:
+            heapq.heapify(heap)
+        self.size = len(pools)
+
+    def sync(self) -> None:
+        """Indexes any pools appended to `pools` since the index was last synchronized."""
+        for pool in self.pools[self.size :]:
+            self.push(pool)
+        self.size = len(self.pools)
+
+    def push(self, pool: Pool, heapify: bool = True) -> None:
+        """Adds `pool` to the heaps of its ticker if it is open. `heapify=False` defers restoring the heap invariant."""
+        if pool.closed:
+            return
+        ticker = pool.asset.ticker.upper()
+        timestamp = pool.purchase_date.timestamp()
+        sequence = next(self._sequence)
+        fifo = self._fifo.setdefault(ticker, [])
+        lifo = self._lifo.setdefault(ticker, [])
+        if heapify:
+            heapq.heappush(fifo, (timestamp, sequence, pool))
+            heapq.heappush(lifo, (-timestamp, sequence, pool))
+        else:
+            fifo.append((timestamp, sequence, pool))
+            lifo.append((-timestamp, sequence, pool))
+
+    def peek(self, ticker: str, strategy: OrderingStrategy) -> Pool:
+        """Returns the next open pool of `ticker` according to `strategy` or `None` if there are no open pools."""
+        if strategy == OrderingStrategy.LIFO:
+            heap = self._lifo.get(ticker.upper())
+        else:
+            heap = self._fifo.get(ticker.upper())
+
+        while heap:
+            pool = heap[0][2]
+            if pool.open:
+                return pool
+            heapq.heappop(heap)  # closed since it was indexed
+        return None
+
+
+class PurchaseIndex:
+    """Per-ticker lists of pools sorted by purchase date, used to find the purchases that could trigger a wash sale.
+    Ties in purchase date are kept in the order in which pools were indexed. Pools that have already triggered a wash
+    sale (`wash.triggers_id` is set) never become eligible again and are pruned when they are encountered.
+    """
+
+    def __init__(self, pools: list[Pool]):
+        self.pools = pools
+        self.size = 0
+        self._sequence = count()
+        self._keys = {}
+        self._pools = {}
+        for pool in pools:
+            ticker = pool.asset.ticker.upper()
+            self._keys.setdefault(ticker, []).append(
+                (pool.purchase_date, next(self._sequence))
+            )
+            self._pools.setdefault(ticker, []).append(pool)
+        for ticker, keys in self._keys.items():
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            self._keys[ticker] = [keys[i] for i in order]
+            self._pools[ticker] = [self._pools[ticker][i] for i in order]
+        self.size = len(pools)
+
+    def sync(self) -> None:
+        """Indexes any pools appended to `pools` since the index was last synchronized."""
+        for pool in self.pools[self.size :]:
+            self.push(pool)
+        self.size = len(self.pools)
+
+    def push(self, pool: Pool) -> None:
+        ticker = pool.asset.ticker.upper()
+        keys = self._keys.setdefault(ticker, [])
+        key = (pool.purchase_date, next(self._sequence))
+        idx = bisect.bisect_right(keys, key)
+        keys.insert(idx, key)
+        self._pools.setdefault(ticker, []).insert(idx, pool)
+
+    def first_unpaired(
+        self, ticker: str, start: datetime.datetime, end: datetime.datetime
+    ) -> Pool:
+        """Returns the earliest pool of `ticker` purchased within [`start`, `end`) that hasn't triggered a wash sale, or
+        `None` if there isn't one."""
+        keys = self._keys.get(ticker.upper(), [])
+        pools = self._pools.get(ticker.upper(), [])
+        idx = bisect.bisect_left(keys, (start,))
+        while idx < len(keys) and keys[idx][0] < end:
+            if pools[idx].wash.triggers_id is None:
+                return pools[idx]
+            del keys[idx], pools[idx]  # already paired
+        return None
+
+
+class IdIndex:
+    """Maps pool ids to their position within `pools`. Ids that appear more than once map to their first position."""
+
+    def __init__(self, pools: list[Pool]):
+        self.pools = pools
+        self.size = 0
+        self.positions = {}
+        self.sync()
+
+    def sync(self) -> None:
+        """Indexes any pools appended to `pools` since the index was last synchronized."""
+        for idx in range(self.size, len(self.pools)):
+            self.positions.setdefault(self.pools[idx].id, idx)
+        self.size = len(self.pools)
+
+    def find(self, id: uuid) -> int:
+        """Returns the position of the pool with id `id` or `None` if the index doesn't hold a valid entry for it."""
+        idx = self.positions.get(id)
+        if idx is None or idx >= len(self.pools) or self.pools[idx].id != id:
+            return None
+        return idx
+
+
 @dataclass
 class PoolRegistry:
     pools: list[Pool] = field(default_factory=list, repr=False)
+    _open_lots: OpenLotIndex = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _ids: IdIndex = field(default=None, init=False, repr=False, compare=False)
+    _purchases: PurchaseIndex = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     def __len__(self) -> int:
         return len(self.pools)
@@ -260,9 +403,9 @@ class PoolRegistry:
             combined_pools = [*self.pools, *item.pools]
             return PoolRegistry(combined_pools)
         if isinstance(item, list):
-            assert [
+            assert all(
                 isinstance(i, Pool) for i in item
-            ].all(), f"Pools appending to `PoolRegistry` must be all be of `Pool` type"
+            ), f"Pools appending to `PoolRegistry` must be all be of `Pool` type"
 
             combined_pools = [*self.pools, *item]
             return PoolRegistry(combined_pools)
@@ -270,7 +413,22 @@ class PoolRegistry:
             combined_pools = [*self.pools, item]
             return PoolRegistry(combined_pools)
         else:
-            raise TypeError(f"")
+            raise TypeError(f"Cannot add {type(item)} to `PoolRegistry`")
+
+    def append(self, pool: Pool) -> None:
+        """Adds `pool` to the end of the registry in place. Unlike `+`, the registry is not copied."""
+        if not isinstance(pool, Pool):
+            raise TypeError(f"Cannot append {type(pool)} to `PoolRegistry`")
+        self.pools.append(pool)
+
+    def extend(self, pools) -> None:
+        """Adds all pools of a `PoolRegistry` or list of `Pool`s to the end of the registry in place."""
+        if isinstance(pools, PoolRegistry):
+            pools = pools.pools
+        pools = list(pools)
+        if not all(isinstance(pool, Pool) for pool in pools):
+            raise TypeError("Pools extending a `PoolRegistry` must all be of `Pool` type")
+        self.pools.extend(pools)
 
     def __iter__(self):
         return self.pools.__iter__()
@@ -301,11 +459,39 @@ class PoolRegistry:
         if isinstance(key, slice):
             start, stop, step = key.indices(len(self))
             self.pools[start:stop:step] = value
+            self._open_lots = None
+            self._purchases = None
+            self._ids = None
         elif isinstance(key, (int, np.integer)):
+            previous = self.pools[key]
+            if previous is not value:
+                self._open_lots = None
+                self._purchases = None
             self.pools[key] = value
+            if previous.id != value.id:
+                self._ids = None
         else:
             raise TypeError(f"Invalid argument type: {type(key)}")
 
+    @property
+    def open_lots(self) -> OpenLotIndex:
+        """Index of the open pools by ticker, built on first use and kept current as pools are appended."""
+        if (
+            self._open_lots is None
+            or self._open_lots.pools is not self.pools
+            or self._open_lots.size > len(self.pools)
+        ):
+            self._open_lots = OpenLotIndex(self.pools)
+        else:
+            self._open_lots.sync()
+        return self._open_lots
+
+    def next_open_pool(self, ticker: str, strategy: OrderingStrategy) -> Pool:
+        """Returns the open pool of `ticker` that the next sale should be matched against under `strategy`, or `None`
+        if no pools of `ticker` are open.
+        """
+        return self.open_lots.peek(ticker, strategy=strategy)
+
     @property
     def closed_pools(self):
         """Pools where the asset has been sold."""
@@ -397,9 +583,49 @@ class PoolRegistry:
         """
         return PoolRegistry([pool for pool in self if not pool.is_wash])
 
+    @property
+    def purchases(self) -> PurchaseIndex:
+        """Index of the pools by ticker and purchase date, built on first use and kept current as pools are appended."""
+        if (
+            self._purchases is None
+            or self._purchases.pools is not self.pools
+            or self._purchases.size > len(self.pools)
+        ):
+            self._purchases = PurchaseIndex(self.pools)
+        else:
+            self._purchases.sync()
+        return self._purchases
+
+    @property
+    def ids(self) -> IdIndex:
+        """Index of pool positions by id, built on first use and kept current as pools are appended."""
+        if (
+            self._ids is None
+            or self._ids.pools is not self.pools
+            or self._ids.size > len(self.pools)
+        ):
+            self._ids = IdIndex(self.pools)
+        else:
+            self._ids.sync()
+        return self._ids
+
     def idx_for_id(self, id: uuid):
         """Returns the index (as currently sorted) within the `pools` list of the pool with id `id`."""
-        return ([pool.id for pool in self]).index(id)
+        idx = self.ids.find(id)
+        if idx is None:
+            self._ids = None  # pools were modified outside of the registry, rebuild
+            idx = self.ids.find(id)
+        if idx is None:
+            raise ValueError(f"{id} is not in `PoolRegistry`")
+        return idx
+
+    def get_by_id(self, id: uuid) -> Pool:
+        """Returns the pool with id `id`."""
+        return self.pools[self.idx_for_id(id)]
+
+    def replace_by_id(self, id: uuid, pool: Pool) -> None:
+        """Replaces the pool with id `id` by `pool`, keeping its position within the registry."""
+        self[self.idx_for_id(id)] = pool
 
     def by_year(self, year: int, by: str = "sale"):
         """Returns pools whose purchase or sale date was in the `year` specified.`"""
@@ -490,11 +716,16 @@ class PoolRegistry:
         """Sorts the pools in the `PoolRegistry` in place by date. `acending=True` sorts oldest to newest."""
         pool_reg = sort_pools(self, by=by, ascending=ascending)
         self.pools = pool_reg.pools
+        self._open_lots = None
+        self._purchases = None
+        self._ids = None
 
     def to_df(self, ascending=True, kind="sales_report"):
         """Converts the `PoolRegistry` object into a pandas DataFrame. Sorts orders by ascending date if `ascending=True`,
         descending date if `ascending=False` or does not change the ordering indicies if `ascending=None`.
         """
+        import pandas as pd
+
         pool_reg = sort_pools(self, by="sale", ascending=ascending)
         if kind == "sales_report":
             df = pd.DataFrame(
@@ -542,6 +773,13 @@ def sort_pools(
     return PoolRegistry(pools=pools)
 
 
+def as_utc(date: datetime.datetime) -> datetime.datetime:
+    """Labels `date` as UTC. Dates that are already in UTC, e.g. from the normalized orderbook, are returned as is."""
+    if date.tzinfo is not None and date.utcoffset() == datetime.timedelta(0):
+        return date
+    return date.replace(tzinfo=datetime.timezone.utc)
+
+
 def date_to_str(date: datetime.datetime, kind: str = "default"):
     if date is None:
         date_str = "None"
@@ -0,0 +1,294 @@
+# %%
+import numpy as np
+import datetime
+from dataclasses import dataclass, field, fields
+from cointracker.objects.asset import Asset
+from cointracker.objects.pool import Pool, PoolRegistry, Wash
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+LONG_TERM = datetime.timedelta(days=366) // MICROSECOND
+
+
+def to_epoch(date: datetime.datetime) -> int:
+    """Converts a date into integer microseconds since the unix epoch. Naive dates are taken to be UTC."""
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return (date - EPOCH) // MICROSECOND
+
+
+def from_epoch(epoch: int) -> datetime.datetime:
+    """Converts integer microseconds since the unix epoch into a UTC datetime."""
+    return EPOCH + datetime.timedelta(microseconds=int(epoch))
+
+
+def object_column(values: list) -> np.ndarray:
+    """Stores `values` in a one-dimensional object array."""
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+@dataclass
+class PoolTable:
+    """Columnar (struct-of-arrays) representation of a `PoolRegistry`. Each pool is a row across the NumPy columns, so
+    aggregates and filters are evaluated vectorized instead of through the `Pool` properties. Dates and the holding period
+    modifier are stored as integer microseconds since the unix epoch, sale columns are `nan`/0 for open pools and
+    `asset_code` indexes into `assets`.
+    """
+
+    assets: list[Asset]
+    asset_code: np.ndarray
+    amount: np.ndarray
+    purchase_epoch: np.ndarray
+    sale_epoch: np.ndarray
+    closed: np.ndarray
+    purchase_cost_fiat: np.ndarray
+    purchase_fee_fiat: np.ndarray
+    sale_value_fiat: np.ndarray
+    sale_fee_fiat: np.ndarray
+    addition_to_cost_fiat: np.ndarray
+    disallowed_loss_fiat: np.ndarray
+    holding_period_modifier: np.ndarray
+    id: np.ndarray
+    triggered_by_id: np.ndarray
+    triggers_id: np.ndarray
+    _fungible: np.ndarray = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._fungible = np.array([asset.fungible for asset in self.assets], dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+    def __repr__(self) -> str:
+        return f"PoolTable(size: {len(self)}, open: {int(self.open.sum())}, closed: {int(self.closed.sum())})"
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = key.upper()
+            codes = [
+                code
+                for code, asset in enumerate(self.assets)
+                if asset.name.upper() == key or asset.ticker.upper() == key
+            ]
+            return self.take(np.isin(self.asset_code, codes))
+        elif isinstance(key, np.ndarray):
+            return self.take(key)
+        else:
+            raise TypeError(f"Invalid argument type: {type(key)}")
+
+    @classmethod
+    def from_pool_reg(cls, pool_reg: PoolRegistry):
+        """Builds the columns from the `Pool` objects within `pool_reg`."""
+        assets = []
+        codes = {}
+        asset_code = []
+        for pool in pool_reg:
+            if pool.asset not in codes:
+                codes[pool.asset] = len(assets)
+                assets.append(pool.asset)
+            asset_code.append(codes[pool.asset])
+
+        closed = [pool.closed for pool in pool_reg]
+        return cls(
+            assets=assets,
+            asset_code=np.array(asset_code, dtype=np.int32),
+            amount=np.array([pool.amount for pool in pool_reg], dtype=float),
+            purchase_epoch=np.array(
+                [to_epoch(pool.purchase_date) for pool in pool_reg], dtype=np.int64
+            ),
+            sale_epoch=np.array(
+                [to_epoch(pool.sale_date) if pool.closed else 0 for pool in pool_reg],
+                dtype=np.int64,
+            ),
+            closed=np.array(closed, dtype=bool),
+            purchase_cost_fiat=np.array(
+                [pool.purchase_cost_fiat for pool in pool_reg], dtype=float
+            ),
+            purchase_fee_fiat=np.array(
+                [pool.purchase_fee_fiat for pool in pool_reg], dtype=float
+            ),
+            sale_value_fiat=np.array(
+                [pool.sale_value_fiat if pool.closed else np.nan for pool in pool_reg],
+                dtype=float,
+            ),
+            sale_fee_fiat=np.array(
+                [pool.sale_fee_fiat if pool.closed else np.nan for pool in pool_reg],
+                dtype=float,
+            ),
+            addition_to_cost_fiat=np.array(
+                [pool.wash.addition_to_cost_fiat for pool in pool_reg], dtype=float
+            ),
+            disallowed_loss_fiat=np.array(
+                [pool.wash.disallowed_loss_fiat for pool in pool_reg], dtype=float
+            ),
+            holding_period_modifier=np.array(
+                [pool.wash.holding_period_modifier // MICROSECOND for pool in pool_reg],
+                dtype=np.int64,
+            ),
+            id=object_column([pool.id for pool in pool_reg]),
+            triggered_by_id=object_column(
+                [pool.wash.triggered_by_id for pool in pool_reg]
+            ),
+            triggers_id=object_column([pool.wash.triggers_id for pool in pool_reg]),
+        )
+
+    def to_pool_reg(self) -> PoolRegistry:
+        """Rebuilds the `Pool` objects from the columns."""
+        pools = []
+        for i in range(len(self)):
+            closed = bool(self.closed[i])
+            pools.append(
+                Pool(
+                    asset=self.assets[self.asset_code[i]],
+                    amount=float(self.amount[i]),
+                    purchase_date=from_epoch(self.purchase_epoch[i]),
+                    purchase_cost_fiat=float(self.purchase_cost_fiat[i]),
+                    purchase_fee_fiat=float(self.purchase_fee_fiat[i]),
+                    sale_date=from_epoch(self.sale_epoch[i]) if closed else None,
+                    sale_value_fiat=float(self.sale_value_fiat[i]) if closed else None,
+                    sale_fee_fiat=float(self.sale_fee_fiat[i]) if closed else None,
+                    wash=Wash(
+                        triggered_by_id=self.triggered_by_id[i],
+                        triggers_id=self.triggers_id[i],
+                        addition_to_cost_fiat=float(self.addition_to_cost_fiat[i]),
+                        disallowed_loss_fiat=float(self.disallowed_loss_fiat[i]),
+                        holding_period_modifier=datetime.timedelta(
+                            microseconds=int(self.holding_period_modifier[i])
+                        ),
+                    ),
+                    id=self.id[i],
+                )
+            )
+        return PoolRegistry(pools=pools)
+
+    def take(self, mask: np.ndarray):
+        """Returns the rows selected by the boolean or integer index `mask` as a new `PoolTable`."""
+        columns = {
+            column.name: getattr(self, column.name)[mask]
+            for column in fields(self)
+            if column.init and column.name != "assets"
+        }
+        return PoolTable(assets=self.assets, **columns)
+
+    # -----Columns derived from the stored ones-----
+
+    @property
+    def open(self) -> np.ndarray:
+        return ~self.closed
+
+    @property
+    def fungible(self) -> np.ndarray:
+        return self._fungible[self.asset_code]
+
+    @property
+    def is_wash(self) -> np.ndarray:
+        return np.not_equal(self.triggered_by_id, None)
+
+    @property
+    def holding_period(self) -> np.ndarray:
+        """Adjusted holding period in microseconds. Only meaningful where `closed`."""
+        return self.sale_epoch - self.purchase_epoch + self.holding_period_modifier
+
+    @property
+    def long_term(self) -> np.ndarray:
+        return self.closed & (self.holding_period >= LONG_TERM)
+
+    @property
+    def tickers(self) -> set:
+        return {self.assets[code].ticker for code in np.unique(self.asset_code)}
+
+    # -----Filters-----
+
+    @property
+    def closed_pools(self):
+        """Pools where the asset has been sold."""
+        return self.take(self.closed)
+
+    @property
+    def open_pools(self):
+        """Pools where the asset has not been sold."""
+        return self.take(self.open)
+
+    @property
+    def shorts(self):
+        """Short-term holding pools."""
+        return self.take(self.closed & ~self.long_term)
+
+    @property
+    def longs(self):
+        """Long-term holding pools."""
+        return self.take(self.long_term)
+
+    @property
+    def nfts(self):
+        """Pools with collectibles/non-fungible tokens."""
+        return self.take(~self.fungible)
+
+    @property
+    def tokens(self):
+        """Pools with fungible tokens."""
+        return self.take(self.fungible)
+
+    @property
+    def washes(self):
+        """All pools that contain a disallowed loss."""
+        return self.take(self.is_wash)
+
+    @property
+    def not_washes(self):
+        """All pools that do not contain a disallowed loss."""
+        return self.take(~self.is_wash)
+
+    def by_year(self, year: int, by: str = "sale"):
+        """Returns pools whose purchase or sale date was in the `year` specified."""
+        if by.lower() == "sale":
+            epoch = self.sale_epoch
+            mask = self.closed
+        elif by.lower() == "purchase":
+            epoch = self.purchase_epoch
+            mask = np.ones(len(self), dtype=bool)
+        else:
+            raise ValueError(f"Unrecognized `by={by}` argument.")
+        years = epoch.astype("datetime64[us]").astype("datetime64[Y]").astype(int) + 1970
+        return self.take(mask & (years == year))
+
+    # -----Aggregates over closed pools-----
+
+    @property
+    def proceeds(self) -> float:
+        """Net proceeds from all pools."""
+        closed = self.closed
+        return np.around(
+            np.sum(self.sale_value_fiat[closed] - self.sale_fee_fiat[closed]), decimals=2
+        )
+
+    @property
+    def cost_basis(self) -> float:
+        """Net cost basis from all pools"""
+        return np.around(np.sum(self._cost_basis[self.closed]), decimals=2)
+
+    @property
+    def disallowed_loss(self) -> float:
+        """Net disallowed loss from all pools."""
+        return np.around(np.sum(self.disallowed_loss_fiat[self.closed]), decimals=2)
+
+    @property
+    def net_gain(self) -> float:
+        """Net gain from all pools."""
+        closed = self.closed
+        net_gain = (
+            self.sale_value_fiat[closed]
+            - self.sale_fee_fiat[closed]
+            - self._cost_basis[closed]
+            + self.disallowed_loss_fiat[closed]
+        )
+        return np.around(np.sum(net_gain), decimals=2)
+
+    @property
+    def _cost_basis(self) -> np.ndarray:
+        return self.purchase_cost_fiat + self.addition_to_cost_fiat + self.purchase_fee_fiat
+
+
+# %%
@@ -1,38 +1,208 @@
-# %% https://algotrading101.com/learn/coinbase-pro-api-guide/
-import cbpro  # requires Python < 3.10 for `requests` to work properly
-import pandas as pd
+# %%
+import datetime
+import threading
+import numpy as np
+from dataclasses import dataclass
+from cointracker.objects.exceptions import UnlistedAssetError
+from cointracker.pricing.fetch import fetch_all
+from cointracker.pricing.history_store import HistoryStore, PriceHistory, history_store
+from cointracker.pricing.price_provider import PriceProvider, day_start
 
-c = cbpro.PublicClient()
+BASE_URL = "https://api.exchange.coinbase.com"
+GRANULARITIES = (60, 300, 900, 3600, 21600, 86400)  # seconds, the candle sizes Coinbase offers
+MAX_CANDLES = 300  # per request
+DAY = 86400
 
-data = pd.DataFrame(c.get_products())
-data.tail().T
 
-ticker = c.get_product_ticker(product_id="ADA-USD")
-ticker
-# %%
-# You can also use the Coinbase Pro REST API endpoints to obtain data in the following way:
-import requests
+@dataclass
+class Candles:
+    times: np.ndarray  # int64 unix seconds of each candle's start, sorted and unique
+    open: np.ndarray
+    close: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def merge(self, other):
+        """Returns the union of both, preferring `other` where they overlap."""
+        keep = ~np.isin(self.times, other.times)
+        times = np.concatenate([self.times[keep], other.times])
+        order = np.argsort(times, kind="stable")
+        return Candles(
+            times=times[order],
+            open=np.concatenate([self.open[keep], other.open])[order],
+            close=np.concatenate([self.close[keep], other.close])[order],
+        )
+
+    def lookup(self, times: np.ndarray, granularity: int, field: str = "open") -> np.ndarray:
+        """Prices of the candles containing each of the unix `times`, `nan` where there is none."""
+        starts = np.asarray(times, dtype=np.int64) // granularity * granularity
+        if len(self) == 0:
+            return np.full(starts.shape, np.nan)
+        idx = np.minimum(np.searchsorted(self.times, starts), len(self) - 1)
+        return np.where(self.times[idx] == starts, getattr(self, field)[idx], np.nan)
+
+
+def empty_candles() -> Candles:
+    return Candles(times=np.empty(0, dtype=np.int64), open=np.empty(0), close=np.empty(0))
+
+
+def unix_seconds(dates) -> np.ndarray:
+    """Converts datetimes (naive ones taken as UTC) into int64 unix seconds."""
+    seconds = []
+    for date in dates:
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        seconds.append(int(date.timestamp()))
+    return np.array(seconds, dtype=np.int64)
+
+
+def iso_utc(seconds: int) -> str:
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat()
+
+
+class CoinbaseProvider(PriceProvider):
+    """Prices of `<ASSET>-USD` from Coinbase Exchange candles. Ranges are split into chunks of at most `MAX_CANDLES`
+    candles, requested concurrently under the Coinbase rate limit and merged into an in-memory candle cache, with daily
+    candles also saved to the offline `store`. Chunks are aligned so that nearby lookups share them and each chunk is
+    only fetched once. Nothing is requested until a price is.
+    """
+
+    name = "coinbase"
+    supports_ranges = True
+    cacheable = False  # daily candles are saved to the history store instead
+
+    def __init__(self, store: HistoryStore = None, base_url: str = BASE_URL):
+        self.store = history_store() if store is None else store
+        self.base_url = base_url
+        self._candles = {}  # (product, granularity): Candles
+        self._fetched = {}  # (product, granularity): set of chunk indices
+        self._pending = {}  # ((product, granularity), chunk index): Event set once its fetch is done
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"CoinbaseProvider({self.base_url})"
+
+    def candles(
+        self, product: str, start: datetime.datetime, end: datetime.datetime, granularity: int = DAY
+    ) -> Candles:
+        """Returns the `product`'s candles from `start` up to `end`, fetching any chunk not cached yet."""
+        first, last = unix_seconds([start, end])
+        span = self._span(granularity)
+        self._fetch(product, granularity, range(first // span, last // span + 1))
+        candles = self._candles.get((product, granularity), empty_candles())
+        keep = (candles.times >= first // granularity * granularity) & (candles.times <= last)
+        return Candles(times=candles.times[keep], open=candles.open[keep], close=candles.close[keep])
+
+    def price(self, asset: str, day: datetime.date) -> float:
+        prices = self.prices({asset: (day_start(day), day_start(day))})[asset]
+        if isinstance(prices, BaseException):
+            raise prices
+        return prices.get(day, 0)
+
+    def prices(self, ranges: dict) -> dict:
+        results = {}
+        for asset, (start, end) in ranges.items():
+            try:
+                candles = self.candles(f"{asset.upper()}-USD", start, end, granularity=DAY)
+            except Exception as error:
+                results[asset] = error
+                continue
+            days = candles.times.astype("datetime64[s]").astype("datetime64[D]").tolist()
+            results[asset] = dict(zip(days, candles.open.tolist()))
+        return results
+
+    def price_at(self, asset: str, date: datetime.datetime, granularity: int = 3600) -> float:
+        """Price of `asset` at a specific time, the open of the `granularity` second candle containing it."""
+        return float(self.prices_at(asset, [date], granularity=granularity)[0])
+
+    def prices_at(self, asset: str, dates: list, granularity: int = 3600) -> np.ndarray:
+        """Intraday prices of `asset` at each of the `dates` from its cached candles, fetching the chunks covering them
+        that aren't cached yet. `nan` where Coinbase has no candle.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Coinbase doesn't offer {granularity}s candles, only {GRANULARITIES}")
+        product = f"{asset.upper()}-USD"
+        times = unix_seconds(dates)
+        self._fetch(product, granularity, np.unique(times // self._span(granularity)).tolist())
+        return self._candles.get((product, granularity), empty_candles()).lookup(times, granularity)
+
+    def _span(self, granularity: int) -> int:
+        return MAX_CANDLES * granularity  # seconds covered by one request
+
+    def _fetch(self, product: str, granularity: int, chunks):
+        """Fetches the `chunks` not cached yet. Chunks are claimed under the lock, so that concurrent lookups wait for
+        the caller already fetching a chunk instead of requesting it again.
+        """
+        key = (product, granularity)
+        claimed, waiting = [], []
+        with self._lock:
+            fetched = self._fetched.setdefault(key, set())
+            for chunk in chunks:
+                if chunk in fetched:
+                    continue
+                if (key, chunk) in self._pending:
+                    waiting.append(self._pending[(key, chunk)])
+                else:
+                    self._pending[(key, chunk)] = threading.Event()
+                    claimed.append(chunk)
+        try:
+            if len(claimed) > 0:
+                self._fetch_chunks(product, granularity, claimed)
+        finally:
+            with self._lock:
+                for chunk in claimed:
+                    self._pending.pop((key, chunk)).set()
+        for event in waiting:
+            event.wait()  # a chunk that failed there is left uncached, to be fetched again by the next lookup
+
+    def _fetch_chunks(self, product: str, granularity: int, chunks: list):
+        key = (product, granularity)
+        span = self._span(granularity)
+        queries = [
+            {
+                "url": f"{self.base_url}/products/{product}/candles",
+                "params": {
+                    "start": iso_utc(chunk * span),
+                    "end": iso_utc((chunk + 1) * span - granularity),  # inclusive
+                    "granularity": granularity,
+                },
+            }
+            for chunk in chunks
+        ]
+        fetched, done, error = empty_candles(), [], None
+        for chunk, response in zip(chunks, fetch_all("coinbase", queries)):
+            try:
+                if isinstance(response, BaseException):
+                    raise response
+                if response.status_code == 404:
+                    raise UnlistedAssetError(f"{product} is not listed on Coinbase")
+                response.raise_for_status()
+                rows = np.array(response.json(), dtype=float).reshape(-1, 6)  # time, low, high, open, close, volume
+            except Exception as chunk_error:
+                error = chunk_error if error is None else error
+                continue
+            times = rows[:, 0].astype(np.int64)
+            order = np.argsort(times, kind="stable")
+            fetched = fetched.merge(Candles(times=times[order], open=rows[order, 3], close=rows[order, 4]))
+            done.append(chunk)
+
+        # keep the chunks that did arrive before reporting any that failed
+        with self._lock:
+            self._candles[key] = self._candles.get(key, empty_candles()).merge(fetched)
+            self._fetched[key].update(done)
+        if granularity == DAY and len(fetched) > 0:
+            self.store.save(
+                product.split("-")[0],
+                PriceHistory(days=fetched.times // DAY, open=fetched.open, close=fetched.close),
+            )
+        if error is not None:
+            raise error
 
-ticker = requests.get("https://api.pro.coinbase.com/products/ADA-USD/ticker").json()
-ticker
 
 # %%
-historical = pd.DataFrame(
-    c.get_product_historic_rates(
-        product_id="ADA-USD",
-        start="2022-04-06T18:06:44+00:00",
-        end="2022-04-07T20:07:44+00:00",
-        granularity=21600,
-    )
-)
-historical.columns = ["Date", "Open", "High", "Low", "Close", "Volume"]
-historical["Date"] = pd.to_datetime(historical["Date"], unit="s")
-historical.set_index("Date", inplace=True)
-historical.sort_values(by="Date", ascending=True, inplace=True)
-historical
-# %%
-candle = requests.get(
-    "https://api.pro.coinbase.com/products/BTC-USD/candles?start=2018-07-10T12:00:00&end=2018-07-15T12:00:00&granularity=3600"
-).json()
-candle
-# %%
+if __name__ == "__main__":
+    coinbase = CoinbaseProvider()
+    start = datetime.datetime(2022, 4, 6, tzinfo=datetime.timezone.utc)
+    print(coinbase.candles("ADA-USD", start, start + datetime.timedelta(days=30)))
+    print(coinbase.price_at("BTC", datetime.datetime(2022, 4, 7, 18, 6, 44, tzinfo=datetime.timezone.utc)))
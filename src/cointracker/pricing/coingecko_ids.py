@@ -0,0 +1,134 @@
+# %%
+import os
+import json
+import pickle
+import hashlib
+import threading
+from pathlib import Path
+from dataclasses import dataclass, field
+from cointracker.settings import config
+
+ID_PATH = Path(__file__).resolve().parents[1] / "data/CoinGeckoIDs.json"
+INDEX_VERSION = 1
+
+# ids of well-known symbols that are shared by bridged/pegged copies of the coin
+PREFERRED_IDS = {
+    "ada": "cardano",
+    "atom": "cosmos",
+    "avax": "avalanche-2",
+    "bnb": "binancecoin",
+    "btc": "bitcoin",
+    "dai": "dai",
+    "doge": "dogecoin",
+    "dot": "polkadot",
+    "eth": "ethereum",
+    "link": "chainlink",
+    "ltc": "litecoin",
+    "matic": "matic-network",
+    "sol": "solana",
+    "uni": "uniswap",
+    "usdc": "usd-coin",
+    "usdt": "tether",
+    "xrp": "ripple",
+}
+
+
+@dataclass
+class CoinGeckoIndex:
+    ids: dict[str, str] = field(default_factory=dict)  # lower case symbol: chosen id
+    collisions: dict[str, list[str]] = field(default_factory=dict)  # symbols shared by several ids: all of them
+    mtime_ns: int = None  # of the JSON file the index was built from
+    size: int = None
+    version: int = INDEX_VERSION
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, symbol: str) -> str:
+        return self.ids[symbol.lower()]
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.lower() in self.ids
+
+    def get(self, symbol: str, default: str = None) -> str:
+        return self.ids.get(symbol.lower(), default)
+
+
+def choose_id(symbol: str, ids: list[str]) -> str:
+    """Picks the id of a symbol deterministically: the preferred id of well-known symbols, otherwise the shortest
+    (bridged and pegged copies add a suffix) and then alphabetically first.
+    """
+    if symbol in PREFERRED_IDS:
+        return PREFERRED_IDS[symbol]
+    return min(ids, key=lambda id: (len(id), id))
+
+
+def build_index(coins) -> CoinGeckoIndex:
+    """Builds the index from either a `{symbol: id}` map or the `coins/list` response (`[{"id", "symbol", ...}]`)."""
+    if isinstance(coins, dict):
+        coins = [{"symbol": symbol, "id": id} for symbol, id in coins.items()]
+    candidates = {}
+    for coin in coins:
+        candidates.setdefault(coin["symbol"].lower(), set()).add(coin["id"])
+    return CoinGeckoIndex(
+        ids={symbol: choose_id(symbol, ids) for symbol, ids in candidates.items()},
+        collisions={symbol: sorted(ids) for symbol, ids in candidates.items() if len(ids) > 1},
+    )
+
+
+def sidecar_path(path: Path, cache_dir: Path = None) -> Path:
+    """Where the index of the JSON file at `path` is pickled, one file per JSON file within `cache_dir`."""
+    cache_dir = Path(config.cfg.paths.cache if cache_dir is None else cache_dir)
+    key = hashlib.sha256(str(Path(path).resolve()).encode()).hexdigest()[:16]
+    return cache_dir / f"coingecko_ids_{key}.pickle"
+
+
+def load_index(path: Path = ID_PATH, cache_dir: Path = None) -> CoinGeckoIndex:
+    """Loads the index from its pickle sidecar in `cache_dir` (`paths.cache` by default), rebuilding the sidecar from
+    the JSON file if that has changed since.
+    """
+    path = Path(path)
+    sidecar = sidecar_path(path, cache_dir)
+    stat = os.stat(path)
+    try:
+        with open(sidecar, "rb") as file:
+            index = pickle.load(file)
+        if (index.version, index.mtime_ns, index.size) == (INDEX_VERSION, stat.st_mtime_ns, stat.st_size):
+            return index
+    except (OSError, EOFError, AttributeError, pickle.UnpicklingError):
+        pass
+
+    with open(path, "r") as file:
+        index = build_index(json.load(file))
+    index.mtime_ns, index.size = stat.st_mtime_ns, stat.st_size
+    temporary = sidecar.with_suffix(".tmp")
+    try:
+        with open(temporary, "wb") as file:
+            pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, sidecar)
+    except OSError:
+        pass  # e.g. a read-only install, the index still works in memory
+    return index
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def coingecko_index(path: Path = ID_PATH) -> CoinGeckoIndex:
+    """Returns the process-wide index of the JSON file at `path`, only reloaded when the file's mtime changes."""
+    path = Path(path)
+    stat = os.stat(path)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None or (index.mtime_ns, index.size) != (stat.st_mtime_ns, stat.st_size):
+            index = _indexes[path] = load_index(path)
+    return index
+
+
+def coingecko_id(symbol: str, path: Path = ID_PATH) -> str:
+    """Returns the CoinGecko id of the ticker `symbol`, or `None` if CoinGecko doesn't list it."""
+    return coingecko_index(path).get(symbol)
+
+
+# %%
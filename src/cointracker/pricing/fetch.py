@@ -0,0 +1,160 @@
+# %%
+import time
+import random
+import asyncio
+import datetime
+import threading
+import requests
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from cointracker.settings import config
+from cointracker.pricing.session import session
+
+RETRY_STATUS = {429, 503}  # rate limited or temporarily unavailable
+BACKOFF_BASE = 1.0  # seconds, doubled on every retry without a `Retry-After` header
+BACKOFF_CAP = 120.0
+MIN_RATE_FRACTION = 0.05  # lowest fraction of the configured rate after repeated 429s
+
+
+class TokenBucket:
+    """Token-bucket rate limiter refilling `rate` tokens per second up to `capacity`. Tokens are reserved rather than
+    waited on (`reserve` returns how long the caller must sleep), so one bucket can be shared between threads and event
+    loops. Being rate limited halves the rate and pauses the bucket, each success then restores a tenth of the
+    configured rate.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self._tat = time.monotonic()  # theoretical arrival time of the next request
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"TokenBucket(rate: {self.rate:.3g}/s, max: {self.max_rate:.3g}/s)"
+
+    @property
+    def _tolerance(self) -> float:
+        return (self.capacity - 1) / self.rate
+
+    def reserve(self) -> float:
+        """Takes a token and returns the number of seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            tat = max(self._tat, now)
+            self._tat = tat + 1 / self.rate
+            return max(0.0, tat - self._tolerance - now)
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+    async def acquire_async(self):
+        await asyncio.sleep(self.reserve())
+
+    def throttle(self, delay: float):
+        """Slows down after being rate limited, holding back all requests for at least `delay` seconds."""
+        with self._lock:
+            self.rate = max(self.rate / 2, self.max_rate * MIN_RATE_FRACTION)
+            self._tat = max(self._tat, time.monotonic() + delay + self._tolerance)
+
+    def recover(self):
+        with self._lock:
+            self.rate = min(self.rate + self.max_rate / 10, self.max_rate)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def limiter(provider: str) -> TokenBucket:
+    """Returns the shared `TokenBucket` of the `provider`, created with its rate from `cfg.pricing.rates`."""
+    with _buckets_lock:
+        if provider not in _buckets:
+            _buckets[provider] = TokenBucket(rate=config.cfg.pricing.rates[provider])
+        return _buckets[provider]
+
+
+def retry_delay(response: requests.Response, attempt: int) -> float:
+    """Seconds to wait before retrying, taken from the `Retry-After` header (seconds or an HTTP date) if present and
+    jittered exponential backoff otherwise.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            date = parsedate_to_datetime(retry_after)
+            return max(0.0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    return min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt) * random.uniform(0.5, 1.0)
+
+
+async def fetch_async(
+    provider: str, url: str, params: dict = None, headers: dict = None, bucket: TokenBucket = None
+) -> requests.Response:
+    """Requests `url` once a token of the `provider` is available, retrying while rate limited. The blocking request
+    runs in a worker thread on the shared keep-alive `session`. Returns the final response, which may still be an error.
+    """
+    if bucket is None:
+        bucket = limiter(provider)
+    for attempt in range(config.cfg.pricing.max_retries + 1):
+        await bucket.acquire_async()
+        response = await asyncio.to_thread(
+            session().get, url, params=params, headers=headers
+        )
+        if response.status_code not in RETRY_STATUS:
+            bucket.recover()
+            return response
+        if attempt < config.cfg.pricing.max_retries:
+            delay = retry_delay(response, attempt)
+            print(f"{provider} returned {response.status_code}...retrying in {delay:.1f}s")
+            bucket.throttle(delay)
+    return response
+
+
+async def fetch_many(
+    provider: str, queries: list[dict], max_in_flight: int = None, bucket: TokenBucket = None
+) -> list:
+    """Runs `fetch_async(provider, **query)` for every query, keeping at most `max_in_flight` requests in flight.
+    Results are returned in order, with the exception in place of the response of any request that raised one.
+    """
+    if max_in_flight is None:
+        max_in_flight = config.cfg.pricing.max_in_flight
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def bounded(query: dict):
+        async with semaphore:
+            return await fetch_async(provider, bucket=bucket, **query)
+
+    return await asyncio.gather(*[bounded(query) for query in queries], return_exceptions=True)
+
+
+def run(coroutine):
+    """Runs the `coroutine` to completion, using a separate thread if an event loop is already running (e.g. in an
+    interactive window).
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def fetch_all(provider: str, queries: list[dict], **kwargs) -> list:
+    """Synchronous wrapper around `fetch_many`."""
+    return run(fetch_many(provider, queries, **kwargs))
+
+
+def fetch(provider: str, url: str, params: dict = None, headers: dict = None) -> requests.Response:
+    """Synchronous single request through the `provider`'s rate limiter."""
+    response = fetch_all(provider, [{"url": url, "params": params, "headers": headers}])[0]
+    if isinstance(response, BaseException):
+        raise response
+    return response
+
+
+# %%
@@ -1,14 +1,15 @@
 import datetime
 from dateutil import parser
-from cointracker.pricing.getYahooPrice import getYahooPrice as gyp
-from cointracker.pricing.getCoinGeckoPrice import getCoinGeckoPrice as gcgp
+from cointracker.pricing.price_cache import PriceCache, price_cache
 
-# maybe use relative imports instead?
-# from .getYahooPrice import getYahooPrice as gyp
-# from .getCoinGeckoPrice import getCoinGeckoPrice as gcgp
 
+def getAssetPrice(asset, date, cache: PriceCache = None):
+    """Returns the USD price of `asset` on the (UTC) day of `date`, or 0 if no provider has it. Prices are resolved by
+    the shared `price_chain()`, which looks them up in the `cache` first (the shared `price_cache()` if not given) and
+    stores any price fetched in it.
+    """
+    from cointracker.pricing.providers import price_chain
 
-def getAssetPrice(asset, date):
     # change all dates into timezone-aware datetime objects to be able to compare
     # NOTE: As (regular) Coinbase doesn't provide accurate timestamps, we have to hope
     # that things work assuming it's 12AM
@@ -18,32 +19,26 @@ def getAssetPrice(asset, date):
         date = parser.parse(date)  # parse the date to datetime
 
     date = date.replace(tzinfo=datetime.timezone.utc)  # convert to non-naive UTC
-    # print('converted date: ', date)
-
-    # startdate = date - datetime.timedelta(days=1)
-
-    price = 0
-
-    if asset == "USD":
-        price = 1
-    else:
-        try:
-            price = gcgp(asset, date)
-            # print('getCoinGecko price: ', price)
-        except Exception:
-            print("Could not get ", asset, "'s CoinGecko price...trying Yahoo")
-            try:
-                yahooPair = asset + "-USD"
-                price = gyp(yahooPair, date, date)
-                # print('getYahooPair price: ', price)
-                price = price.loc[0, "Open"]
-            except Exception:
-                print("Cannot get ", asset, "'s price")
-
-    if price == 0:
-        print("0 priced Asset: ", asset)
-    # print('price being returned: ', price)
-    return price
+
+    if cache is None:
+        cache = price_cache()
+    return price_chain().price(asset, date, cache=cache)
+
+
+def getAssetPrices(asset, dates, cache: PriceCache = None) -> dict:
+    """Returns the USD prices of `asset` on each of the (UTC) days of `dates`, keyed by `datetime.date`."""
+    return getAllAssetPrices({asset: dates}, cache=cache)[asset]
+
+
+def getAllAssetPrices(dates: dict, cache: PriceCache = None) -> dict:
+    """Returns the USD prices of each `{asset: dates}` on the (UTC) days of its dates as `{asset: {date: price}}`. Days
+    that aren't cached are fetched with one range request per asset where the provider supports it.
+    """
+    from cointracker.pricing.providers import price_chain
+
+    if cache is None:
+        cache = price_cache()
+    return price_chain().prices(dates, cache=cache)
 
 
 if __name__ == "__main__":
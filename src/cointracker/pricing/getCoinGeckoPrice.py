@@ -1,14 +1,13 @@
 # %%
-import requests
 import json
-import os
-import time
-from pathlib import Path
+import logging
+import datetime
+from cointracker.pricing.fetch import fetch, fetch_all
+from cointracker.pricing.session import session
+from cointracker.objects.exceptions import UnlistedAssetError
+from cointracker.pricing.coingecko_ids import ID_PATH, coingecko_id, coingecko_index
 
-WAITSHORT = 2  # free api is limited to 10-30 calls per minute or one every 2-6 seconds.
-WAITLONG = 6.01
-TIMEOUT = 91
-ID_PATH = Path(__file__).resolve().parent / "data/CoinGeckoIDs.json"
+# free api is limited to 10-30 calls per minute, see `pricing.rates` in the config
 
 
 def getCoinGeckoPrice(asset, date):
@@ -25,43 +24,78 @@ def getCoinGeckoPrice(asset, date):
     """
     date_string = date.strftime("%d-%m-%Y")  # format date
 
-    try:
-        # with open(filepath, 'r') as fr:  # import saved ID dictionary
-        with open(ID_PATH, "r") as fr:  # import saved ID dictionary
-            idDict = json.load(fr)
-
-        ID = idDict[asset.lower()]
-    except Exception:
-        print("Error, couldn't find CoinGeckoIDs.json in")
-        SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
-        print(SCRIPTDIR, "\\data")
-        price = 0
+    ID = coingecko_id(asset)  # memoized index of CoinGeckoIDs.json
+    if ID is None:
+        raise UnlistedAssetError(f"{asset} has no CoinGecko ID")
 
     url = (
         "https://api.coingecko.com/api/v3/coins/" + ID + "/history?date=" + date_string
     )
+    gecko = None
     try:
-        gecko = requests.get(url)
-
-        if gecko.status_code == 429:  # if too many requests error sent
-            print(f"Too many CoinGecko requests...waiting {TIMEOUT}s for timeout")
-            time.sleep(TIMEOUT)
-            gecko = requests.get(url)
-        time.sleep(WAITLONG)
+        gecko = fetch("coingecko", url)  # rate limited, retries if too many requests
         price = gecko.json()["market_data"]["current_price"]["usd"]
-        print(f"Received price data for {asset} on {date}: {price} USD")
-    except Exception:
-        print("Bad CoinGecko request URL")
-        print(url)
-        print(gecko.status_code)
+        logging.debug("Received price data for %s on %s: %s USD", asset, date, price)
+    except Exception as error:
+        status = None if gecko is None else gecko.status_code
+        logging.warning("Bad CoinGecko request %s (status %s): %r", url, status, error)
         price = 0
 
     return price
 
 
+def getCoinGeckoPriceRange(asset, start, end) -> dict:
+    """Fetches the USD prices of the asset ticker from `start` to `end` (datetimes) with a single `market_chart/range`
+    request. Returns the first price within each UTC day keyed by `datetime.date`, matching the daily open that
+    `getCoinGeckoPrice` provides. Raises an exception if the request fails.
+    """
+    result = getCoinGeckoPriceRanges({asset: (start, end)})[asset]
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def getCoinGeckoPriceRanges(ranges: dict) -> dict:
+    """Fetches several `{asset: (start, end)}` price ranges concurrently under the CoinGecko rate limit. Returns the
+    daily prices of each asset as `getCoinGeckoPriceRange` does, or the exception raised for it.
+    """
+    index = coingecko_index()
+    results, queries = {}, {}
+    for asset, (start, end) in ranges.items():
+        if asset not in index:
+            results[asset] = UnlistedAssetError(f"{asset} has no CoinGecko ID")
+            continue
+        queries[asset] = {
+            "url": "https://api.coingecko.com/api/v3/coins/"
+            + index[asset]
+            + "/market_chart/range",
+            "params": {
+                "vs_currency": "usd",
+                "from": int(start.timestamp()),
+                "to": int(end.timestamp()),
+            },
+        }
+
+    responses = fetch_all("coingecko", list(queries.values()))
+    for asset, gecko in zip(queries, responses):
+        try:
+            if isinstance(gecko, BaseException):
+                raise gecko
+            gecko.raise_for_status()
+            prices = {}
+            for timestamp, price in sorted(gecko.json()["prices"]):
+                day = datetime.datetime.fromtimestamp(timestamp / 1000, tz=datetime.timezone.utc)
+                prices.setdefault(day.date(), price)  # keep the earliest price of the day
+            print(f"Received {len(prices)} days of price data for {asset}")
+            results[asset] = prices
+        except Exception as error:
+            results[asset] = error
+    return results
+
+
 def updateCoinGeckoIDs():
     # query's the CoinGecko API to generate a ticker:ID dictionary
-    coinList = requests.get("https://api.coingecko.com/api/v3/coins/list").json()
+    coinList = session().get("https://api.coingecko.com/api/v3/coins/list").json()
     """
     filepath = 'unknown'
     rootDir = '.'
@@ -72,15 +106,12 @@ def updateCoinGeckoIDs():
             if fname == 'CoinGeckoIDs.json':
                 filepath = dirName + '\\' + fname
     """
-    idDict = {}
-    for coin in coinList:
-        idDict[coin["symbol"].lower()] = coin["id"]
-
-    # save dictionary locally
+    # save the full list locally, symbols shared by several coins are resolved by `coingecko_ids.choose_id`
+    coinList = [{key: coin[key] for key in ("id", "symbol", "name")} for coin in coinList]
     # with open(filepath, 'w+') as fw:
     print(f"ID_PATH: {ID_PATH}")
     with open(ID_PATH, "w+") as fw:
-        json.dump(idDict, fw, indent=4)
+        json.dump(coinList, fw, indent=4)
     return
 
 
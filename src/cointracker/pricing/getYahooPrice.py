@@ -1,6 +1,11 @@
-from datetime import datetime, timedelta
-import time, requests, pandas, lxml
+from datetime import datetime, timedelta, timezone
+import time, pandas, lxml
 from lxml import html
+from cointracker.pricing.fetch import fetch, fetch_all
+from cointracker.objects.exceptions import UnlistedAssetError
+
+CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64)"
 
 
 def getYahooPrice(symbol, start, end):
@@ -16,6 +21,53 @@ def getYahooPrice(symbol, start, end):
     return scraped
 
 
+def getYahooPriceRanges(ranges: dict) -> dict:
+    """Fetches the daily opens of several `{symbol: (start, end)}` ranges (e.g. `{"BTC-USD": ...}`) from Yahoo's chart
+    JSON API, one request per symbol under the Yahoo rate limit. Returns `{symbol: {datetime.date: price}}` with every
+    day returned, or the exception raised for the symbol, an `UnlistedAssetError` if Yahoo doesn't know it.
+    """
+    symbols = list(ranges)
+    queries = [
+        {
+            "url": CHART_URL + symbol,
+            "params": {
+                "period1": int(start.timestamp()),
+                "period2": int(end.timestamp()),
+                "interval": "1d",
+                "includePrePost": "false",
+            },
+            "headers": {"User-Agent": USER_AGENT},
+        }
+        for symbol, (start, end) in ranges.items()
+    ]
+    results = {}
+    for symbol, response in zip(symbols, fetch_all("yahoo", queries)):
+        try:
+            if isinstance(response, BaseException):
+                raise response
+            if response.status_code == 404:
+                raise UnlistedAssetError(f"{symbol} is not listed on Yahoo")
+            response.raise_for_status()
+            results[symbol] = parse_chart(response.json())
+        except Exception as error:
+            results[symbol] = error
+    return results
+
+
+def parse_chart(chart: dict) -> dict:
+    """Reads the daily opens from a chart API response as `{datetime.date: price}`."""
+    if chart["chart"].get("error"):
+        raise ValueError(chart["chart"]["error"])
+    result = chart["chart"]["result"][0]
+    opens = result["indicators"]["quote"][0].get("open", [])
+    prices = {}
+    for timestamp, price in zip(result.get("timestamp", []), opens):
+        if price is not None:
+            day = datetime.fromtimestamp(timestamp, tz=timezone.utc).date()
+            prices.setdefault(day, price)
+    return prices
+
+
 def format_date(date_datetime):
     # Example
     # datetime_start = datetime.today() - timedelta(days=1000)
@@ -60,7 +112,7 @@ def header_function(subdomain):
 
 
 def scrape_page(url, header):
-    page = requests.get(url, params=header)
+    page = fetch("yahoo", url, params=header)
     element_html = html.fromstring(page.content)
     table = element_html.xpath("//table")
     table_tree = lxml.etree.tostring(table[0], method="xml")
@@ -0,0 +1,177 @@
+# %%
+import os
+import logging
+import datetime
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from dataclasses import dataclass
+from cointracker.settings import config
+
+FIELDS = ("days", "open", "close")
+DATE_COLUMNS = ("date", "snapped_at", "time", "timestamp")
+OPEN_COLUMNS = ("open", "price")
+CLOSE_COLUMNS = ("close", "price")
+
+
+@dataclass
+class PriceHistory:
+    days: np.ndarray  # int64 days since the unix epoch (UTC), sorted and unique
+    open: np.ndarray  # float64 USD
+    close: np.ndarray  # float64 USD
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def lookup(self, days: np.ndarray, field: str = "open") -> np.ndarray:
+        """Prices on each of the epoch `days`, `nan` where the history has no entry for the day."""
+        days = np.asarray(days, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(days.shape, np.nan)
+        idx = np.minimum(np.searchsorted(self.days, days), len(self) - 1)
+        return np.where(self.days[idx] == days, getattr(self, field)[idx], np.nan)
+
+
+def epoch_days(dates) -> np.ndarray:
+    """Converts dates (or a column of them) into int64 days since the unix epoch of their UTC day."""
+    if isinstance(dates, (datetime.date, datetime.datetime)):
+        dates = [dates]
+    dates = pd.to_datetime(pd.Series(dates), utc=True)
+    return dates.dt.tz_localize(None).to_numpy().astype("datetime64[D]").astype(np.int64)
+
+
+class HistoryStore:
+    """Offline daily price history saved per asset as `.npy` arrays (`<TICKER>.days.npy`, `.open.npy`, `.close.npy`)
+    within `directory`. The arrays are memory-mapped when first used, so lookups only page in what they touch.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._histories = {}
+        self._lock = threading.RLock()  # `save` looks up the stored history while holding it
+
+    def __repr__(self) -> str:
+        return f"HistoryStore({self.directory}, assets: {len(self.tickers)})"
+
+    def __contains__(self, ticker: str) -> bool:
+        return self._path(ticker, "days").exists()
+
+    @property
+    def tickers(self) -> list[str]:
+        if not self.directory.exists():
+            return []
+        return sorted(path.name[: -len(".days.npy")] for path in self.directory.glob("*.days.npy"))
+
+    def history(self, ticker: str) -> PriceHistory:
+        """Returns the memory-mapped history of `ticker`, or `None` if the store has none."""
+        ticker = ticker.upper()
+        with self._lock:
+            if ticker not in self._histories:
+                if ticker in self:
+                    self._histories[ticker] = PriceHistory(
+                        **{field: np.load(self._path(ticker, field), mmap_mode="r") for field in FIELDS}
+                    )
+                else:
+                    self._histories[ticker] = None
+            return self._histories[ticker]
+
+    def lookup(self, ticker: str, days: np.ndarray, field: str = "open") -> np.ndarray:
+        """Prices of `ticker` on each of the epoch `days`, `nan` where there are none."""
+        history = self.history(ticker)
+        if history is None:
+            return np.full(np.shape(days), np.nan)
+        return history.lookup(days, field=field)
+
+    def save(self, ticker: str, history: PriceHistory):
+        """Merges `history` into the stored one, replacing the prices of days present in both. Saves of the same store
+        are serialized so that concurrent ones can't drop each other's days.
+        """
+        with self._lock:
+            existing = self.history(ticker)
+            if existing is not None:
+                keep = ~np.isin(existing.days, history.days)
+                history = PriceHistory(
+                    **{
+                        field: np.concatenate([np.array(getattr(existing, field)[keep]), getattr(history, field)])
+                        for field in FIELDS
+                    }
+                )
+            # release the memory maps before replacing the files, they can't be replaced while mapped on Windows
+            del existing
+            self._histories.pop(ticker.upper(), None)
+            order = np.argsort(history.days, kind="stable")
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for field in FIELDS:
+                values = getattr(history, field)[order].astype(np.int64 if field == "days" else np.float64)
+                temporary = self._path(ticker, field).with_suffix(".tmp.npy")
+                np.save(temporary, values)
+                os.replace(temporary, self._path(ticker, field))
+
+    def import_csv(self, filename, ticker: str = None) -> int:
+        """Imports a daily OHLC (or CoinGecko `snapped_at`/`price`) CSV file and returns the number of days read. The
+        ticker defaults to the file name before any `-`, e.g. `ETH-USD.csv`.
+        """
+        filename = Path(filename)
+        if ticker is None:
+            ticker = filename.stem.split("-")[0]
+        df = pd.read_csv(filename)
+        columns = {column.lower().strip(): column for column in df.columns}
+
+        def find(candidates: tuple) -> str:
+            for candidate in candidates:
+                if candidate in columns:
+                    return columns[candidate]
+            raise KeyError(f"{filename.name} has none of the columns {candidates}")
+
+        dates = df[find(DATE_COLUMNS)]
+        if pd.api.types.is_numeric_dtype(dates):
+            dates = pd.to_datetime(dates, unit="ms" if dates.max() > 1e11 else "s", utc=True)
+        df = pd.DataFrame(
+            {
+                "days": epoch_days(dates),
+                "open": pd.to_numeric(df[find(OPEN_COLUMNS)], errors="coerce").to_numpy(),
+                "close": pd.to_numeric(df[find(CLOSE_COLUMNS)], errors="coerce").to_numpy(),
+            }
+        )
+        df = df.dropna().drop_duplicates(subset="days", keep="last")
+        self.save(ticker, PriceHistory(**{field: df[field].to_numpy() for field in FIELDS}))
+        logging.info("Imported %s days of %s prices from %s", len(df), ticker.upper(), filename.name)
+        return len(df)
+
+    def import_csv_dir(self, directory) -> int:
+        """Imports every CSV file within `directory`, see `import_csv`."""
+        return sum(self.import_csv(filename) for filename in sorted(Path(directory).glob("*.csv")))
+
+    def _path(self, ticker: str, field: str) -> Path:
+        return self.directory / f"{ticker.upper()}.{field}.npy"
+
+
+_history_store = None
+_history_store_lock = threading.Lock()
+
+
+def history_store() -> HistoryStore:
+    """Returns the shared store at `cfg.pricing.history_dir`."""
+    global _history_store
+    with _history_store_lock:
+        if _history_store is None:
+            _history_store = HistoryStore(config.cfg.pricing.history_dir)
+    return _history_store
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Import daily price history CSV files.")
+    arg_parser.add_argument("paths", nargs="+", help="CSV files or directories of them")
+    arg_parser.add_argument("--ticker", help="ticker of a single CSV file")
+    args = arg_parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for path in map(Path, args.paths):
+        if path.is_dir():
+            history_store().import_csv_dir(path)
+        else:
+            history_store().import_csv(path, ticker=args.ticker)
+
+# %%
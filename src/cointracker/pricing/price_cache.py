@@ -0,0 +1,157 @@
+# %%
+import sqlite3
+import datetime
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+from cointracker.settings import config
+
+QUOTE = "USD"  # the providers only quote prices in USD
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+
+    def __str__(self) -> str:
+        return f"price cache hits: {self.hits}, misses: {self.misses}, writes: {self.writes}"
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def utc_day(date) -> datetime.date:
+    """Returns the UTC calendar day of `date`. Naive datetimes are taken to be UTC."""
+    if isinstance(date, datetime.datetime):
+        if date.tzinfo is not None:
+            date = date.astimezone(datetime.timezone.utc)
+        return date.date()
+    elif isinstance(date, datetime.date):
+        return date
+    else:
+        raise TypeError(f"Invalid date type: {type(date)}")
+
+
+class PriceCache:
+    """Persistent spot-price cache stored in a SQLite file and keyed by (ticker, UTC day, quote currency). SQLite's own
+    file locking lets several processes share the file, while a `threading.Lock` serializes use of the connection within
+    a process. Hit/miss counts for this instance are kept in `stats`.
+    """
+
+    def __init__(self, path, timeout: float = 30.0):
+        self.path = Path(path)
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            self.path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS prices ("
+                "ticker TEXT NOT NULL, day TEXT NOT NULL, quote TEXT NOT NULL, price REAL NOT NULL, "
+                "source TEXT, fetched TEXT NOT NULL, PRIMARY KEY (ticker, day, quote))"
+            )
+
+    def __repr__(self) -> str:
+        return f"PriceCache({self.path}, entries: {len(self)})"
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+
+    def __contains__(self, key: tuple) -> bool:
+        ticker, date, *quote = key
+        with self._lock:
+            return self._lookup(ticker, date, *quote) is not None
+
+    def get(self, ticker: str, date, quote: str = QUOTE) -> float:
+        """Returns the cached price of `ticker` on the UTC day of `date`, or `None` if it hasn't been cached."""
+        with self._lock:
+            price = self._lookup(ticker, date, quote)
+            if price is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+        return price
+
+    def set(self, ticker: str, date, price: float, quote: str = QUOTE, source: str = None):
+        """Stores `price`, replacing any existing entry for the same key."""
+        self.set_many([(ticker, date, price)], quote=quote, source=source)
+
+    def set_many(self, entries: list[tuple], quote: str = QUOTE, source: str = None):
+        """Stores `(ticker, date, price)` entries within a single transaction."""
+        fetched = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        rows = [
+            (ticker.upper(), utc_day(date).isoformat(), quote.upper(), float(price), source, fetched)
+            for ticker, date, price in entries
+        ]
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self.stats.writes += len(rows)
+
+    def invalidate(
+        self, ticker: str = None, start=None, end=None, quote: str = None
+    ) -> int:
+        """Deletes the entries matching all of the criteria given (every entry if none are) and returns how many were
+        removed. `start` and `end` are inclusive UTC days.
+        """
+        conditions, values = [], []
+        if ticker is not None:
+            conditions.append("ticker = ?")
+            values.append(ticker.upper())
+        if start is not None:
+            conditions.append("day >= ?")
+            values.append(utc_day(start).isoformat())
+        if end is not None:
+            conditions.append("day <= ?")
+            values.append(utc_day(end).isoformat())
+        if quote is not None:
+            conditions.append("quote = ?")
+            values.append(quote.upper())
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            return self._connection.execute(f"DELETE FROM prices{where}", values).rowcount
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _lookup(self, ticker: str, date, quote: str = QUOTE) -> float:
+        row = self._connection.execute(
+            "SELECT price FROM prices WHERE ticker = ? AND day = ? AND quote = ?",
+            (ticker.upper(), utc_day(date).isoformat(), quote.upper()),
+        ).fetchone()
+        return None if row is None else row[0]
+
+
+_price_cache = None
+_price_cache_lock = threading.Lock()
+
+
+def price_cache() -> PriceCache:
+    """Returns the shared cache at `cfg.pricing.cache_file`, or `None` if caching is disabled. The file is only opened
+    on first use.
+    """
+    global _price_cache
+    if not config.cfg.pricing.cache:
+        return None
+    with _price_cache_lock:
+        if _price_cache is None:
+            _price_cache = PriceCache(config.cfg.pricing.cache_file)
+    return _price_cache
+
+
+# %%
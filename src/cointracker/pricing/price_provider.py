@@ -0,0 +1,29 @@
+import datetime
+
+
+def day_start(day: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time(), datetime.timezone.utc)
+
+
+class PriceProvider:
+    """Source of daily USD prices. `price` returns 0 if the provider has no price for that day and raises an
+    `UnlistedAssetError` if it doesn't list the asset at all. Providers that can fetch many days at once set
+    `supports_ranges` and implement `prices`. Prices from providers that aren't `cacheable` aren't written to the price
+    cache.
+    """
+
+    name = None
+    supports_ranges = False
+    cacheable = True
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}()"
+
+    def price(self, asset: str, day: datetime.date) -> float:
+        raise NotImplementedError
+
+    def prices(self, ranges: dict) -> dict:
+        """Fetches `{asset: (start, end)}` ranges and returns `{asset: {day: price}}`, with the exception raised in
+        place of the prices of any asset that failed.
+        """
+        raise NotImplementedError
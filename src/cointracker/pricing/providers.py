@@ -0,0 +1,284 @@
+# %%
+import time
+import datetime
+import threading
+import numpy as np
+from dataclasses import dataclass
+from cointracker.objects.exceptions import UnlistedAssetError
+from cointracker.pricing.getYahooPrice import getYahooPrice as gyp
+from cointracker.pricing.getYahooPrice import getYahooPriceRanges as gypr
+from cointracker.pricing.getCoinGeckoPrice import getCoinGeckoPriceRanges as gcgpr
+from cointracker.pricing.price_cache import PriceCache, utc_day, QUOTE
+from cointracker.pricing.history_store import HistoryStore, epoch_days, history_store
+from cointracker.pricing.coinbase_api import CoinbaseProvider
+from cointracker.pricing.price_provider import PriceProvider, day_start
+from cointracker.settings import config
+
+
+class CoinGeckoProvider(PriceProvider):
+    name = "coingecko"
+    supports_ranges = True
+
+    def price(self, asset: str, day: datetime.date) -> float:
+        fetched = self.prices({asset: (day_start(day), day_start(day) + datetime.timedelta(days=1))})
+        if isinstance(fetched[asset], BaseException):
+            raise fetched[asset]
+        return fetched[asset].get(day, 0)
+
+    def prices(self, ranges: dict) -> dict:
+        return gcgpr(ranges)
+
+
+class YahooProvider(PriceProvider):
+    """Yahoo prices of `<ASSET>-USD`. In `chart` mode every day of a range comes from a single chart API request, in
+    `scrape` mode each day is scraped from the history page.
+    """
+
+    name = "yahoo"
+
+    def __init__(self, mode: str = None):
+        self.mode = config.cfg.pricing.yahoo_mode if mode is None else mode.lower()
+        if self.mode not in ("chart", "scrape"):
+            raise ValueError(f"Unrecognized Yahoo mode `{self.mode}`")
+
+    def __repr__(self) -> str:
+        return f"YahooProvider(mode={self.mode})"
+
+    @property
+    def supports_ranges(self) -> bool:
+        return self.mode == "chart"
+
+    def prices(self, ranges: dict) -> dict:
+        fetched = gypr({f"{asset}-USD": dates for asset, dates in ranges.items()})
+        return {asset: fetched[f"{asset}-USD"] for asset in ranges}
+
+    def price(self, asset: str, day: datetime.date) -> float:
+        if self.mode == "chart":
+            fetched = self.prices({asset: (day_start(day), day_start(day) + datetime.timedelta(days=1))})
+            if isinstance(fetched[asset], BaseException):
+                raise fetched[asset]
+            return fetched[asset].get(day, 0)
+        try:
+            table = gyp(asset + "-USD", day_start(day), day_start(day))
+        except IndexError:  # no price table on the page
+            raise UnlistedAssetError(f"{asset} is not listed on Yahoo")
+        try:
+            return float(table.loc[0, "Open"])
+        except (KeyError, TypeError, ValueError):
+            return 0
+
+
+class HistoryProvider(PriceProvider):
+    """Daily opens from the offline `HistoryStore`."""
+
+    name = "history"
+    supports_ranges = True
+    cacheable = False  # already stored locally
+
+    def __init__(self, store: HistoryStore = None):
+        self.store = history_store() if store is None else store
+
+    def price(self, asset: str, day: datetime.date) -> float:
+        return self.prices({asset: (day_start(day), day_start(day))})[asset].get(day, 0)
+
+    def prices(self, ranges: dict) -> dict:
+        results = {}
+        for asset, (start, end) in ranges.items():
+            history = self.store.history(asset)
+            if history is None:
+                results[asset] = UnlistedAssetError(f"{asset} has no offline price history")
+                continue
+            first, last = epoch_days([start, end])
+            lo = np.searchsorted(history.days, first, side="left")
+            hi = np.searchsorted(history.days, last, side="right")
+            days = history.days[lo:hi].astype("datetime64[D]").tolist()
+            results[asset] = dict(zip(days, history.open[lo:hi].tolist()))
+        return results
+
+
+PROVIDERS = {
+    provider.name: provider
+    for provider in [HistoryProvider, CoinGeckoProvider, YahooProvider, CoinbaseProvider]
+}
+
+
+@dataclass
+class CircuitBreaker:
+    """Stops calling a provider after `threshold` consecutive failures until `reset_after` seconds have passed. A
+    failure after that reopens it straight away, a success closes it.
+    """
+
+    threshold: int = 3
+    reset_after: float = 300.0
+    failures: int = 0
+    opened: float = None  # `time.monotonic()` when the breaker opened
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened is not None and time.monotonic() - self.opened < self.reset_after
+
+    def allow(self) -> bool:
+        return not self.is_open
+
+    def success(self):
+        self.failures = 0
+        self.opened = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened = time.monotonic()
+
+
+class ProviderChain:
+    """Resolves prices by trying each of the `providers` in order, checking the `cache` first (no caching if `None`)
+    and storing the prices found in it. Each provider has a `CircuitBreaker`, and assets a provider doesn't list are
+    remembered so that it is skipped for them on later lookups. Assets in `unit_priced` are worth 1 without a lookup.
+    """
+
+    def __init__(
+        self,
+        providers: list[PriceProvider],
+        cache: PriceCache = None,
+        unit_priced: set[str] = None,
+        breaker_threshold: int = 3,
+        breaker_reset: float = 300.0,
+    ):
+        self.providers = providers
+        self.cache = cache
+        self.unit_priced = {ticker.upper() for ticker in (unit_priced or {QUOTE})}
+        self.breakers = {
+            provider.name: CircuitBreaker(threshold=breaker_threshold, reset_after=breaker_reset)
+            for provider in providers
+        }
+        self.unlisted = set()  # (provider name, asset ticker)
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"ProviderChain({[provider.name for provider in self.providers]})"
+
+    def available(self, provider: PriceProvider, asset: str) -> bool:
+        with self._lock:
+            return (provider.name, asset.upper()) not in self.unlisted and self.breakers[
+                provider.name
+            ].allow()
+
+    def price(self, asset: str, date, cache: PriceCache = None) -> float:
+        """Returns the USD price of `asset` on the UTC day of `date`, or 0 if no provider has it."""
+        return self.prices({asset: [date]}, cache=cache)[asset][utc_day(date)]
+
+    def prices(self, dates: dict, cache: PriceCache = None) -> dict:
+        """Returns the USD prices of each `{asset: dates}` on the UTC days of its dates as `{asset: {date: price}}`.
+        Providers supporting ranges fetch all of an asset's missing days with one request, others day by day. Every day a
+        range returns is cached, not just the ones asked for.
+        """
+        cache = self.cache if cache is None else cache
+        prices, missing = {}, {}
+        for asset, asset_dates in dates.items():
+            days = sorted({utc_day(date) for date in asset_dates})
+            if asset.upper() in self.unit_priced:
+                prices[asset] = {day: 1.0 for day in days}
+                continue
+            prices[asset] = {}
+            if cache is not None:
+                for day in days:
+                    cached = cache.get(asset, day)
+                    if cached is not None:
+                        prices[asset][day] = cached
+            missing[asset] = [day for day in days if day not in prices[asset]]
+
+        for provider in self.providers:
+            eligible = {
+                asset: days
+                for asset, days in missing.items()
+                if len(days) > 0 and self.available(provider, asset)
+            }
+            if len(eligible) == 0:
+                continue
+            if provider.supports_ranges:
+                found = self._fetch_ranges(provider, eligible)
+            else:
+                found = self._fetch_days(provider, eligible)
+            for asset, asset_prices in found.items():
+                prices[asset].update(
+                    {day: asset_prices[day] for day in missing[asset] if day in asset_prices}
+                )
+                missing[asset] = [day for day in missing[asset] if day not in asset_prices]
+                if cache is not None and provider.cacheable and len(asset_prices) > 0:
+                    cache.set_many(
+                        [(asset, day, price) for day, price in asset_prices.items()],
+                        source=provider.name,
+                    )
+
+        for asset, days in missing.items():
+            for day in days:
+                print(f"0 priced Asset: {asset} on {day}")
+                prices[asset][day] = 0
+        return prices
+
+    def _fetch_ranges(self, provider: PriceProvider, eligible: dict) -> dict:
+        ranges = {
+            asset: (day_start(days[0]), day_start(days[-1]) + datetime.timedelta(days=1))
+            for asset, days in eligible.items()
+        }
+        found = {}
+        for asset, fetched in provider.prices(ranges).items():
+            if isinstance(fetched, BaseException):
+                self._failed(provider, asset, fetched)
+                continue
+            self._succeeded(provider)
+            found[asset] = {day: price for day, price in fetched.items() if price != 0}
+        return found
+
+    def _fetch_days(self, provider: PriceProvider, eligible: dict) -> dict:
+        found = {}
+        for asset, days in eligible.items():
+            found[asset] = {}
+            for day in days:
+                if not self.available(provider, asset):
+                    break
+                try:
+                    price = provider.price(asset, day)
+                except Exception as error:
+                    self._failed(provider, asset, error)
+                    continue
+                self._succeeded(provider)
+                if price != 0:
+                    found[asset][day] = price
+        return found
+
+    def _succeeded(self, provider: PriceProvider):
+        with self._lock:
+            self.breakers[provider.name].success()
+
+    def _failed(self, provider: PriceProvider, asset: str, error: Exception):
+        with self._lock:
+            if isinstance(error, UnlistedAssetError):
+                self.unlisted.add((provider.name, asset.upper()))
+                print(f"{asset} is not listed by {provider.name}...skipping it there from now on")
+            else:
+                self.breakers[provider.name].failure()
+                print(f"Could not get {asset}'s {provider.name} price ({error!r})")
+
+
+_price_chain = None
+_price_chain_lock = threading.Lock()
+
+
+def price_chain() -> ProviderChain:
+    """Returns the chain shared across lookups, built from `cfg.pricing` on first use. The default fiat currency and
+    the configured stablecoins are unit priced. It has no cache of its own, callers pass theirs in.
+    """
+    global _price_chain
+    with _price_chain_lock:
+        if _price_chain is None:
+            _price_chain = ProviderChain(
+                providers=[PROVIDERS[name]() for name in config.cfg.pricing.providers],
+                unit_priced={config.cfg.processing.default_fiat, *config.cfg.pricing.stablecoins},
+                breaker_threshold=config.cfg.pricing.breaker_threshold,
+                breaker_reset=config.cfg.pricing.breaker_reset,
+            )
+    return _price_chain
+
+
+# %%
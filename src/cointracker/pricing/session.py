@@ -0,0 +1,135 @@
+# %%
+import random
+import threading
+import statistics
+from collections import deque
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cointracker.settings import config
+
+RETRY_STATUS = (500, 502, 504)  # 429/503 are left to the rate limiter in `fetch`
+LATENCY_SAMPLES = 1000  # most recent latencies kept per host
+
+
+class JitteredRetry(Retry):
+    """`Retry` whose exponential backoff is scaled by a random factor so that retries don't arrive in lockstep."""
+
+    def get_backoff_time(self) -> float:
+        return super().get_backoff_time() * random.uniform(0.5, 1.0)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """`HTTPAdapter` applying a default timeout to requests that don't specify one."""
+
+    def __init__(self, *args, timeout: float = None, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+@dataclass
+class LatencyStats:
+    requests: int = 0
+    errors: int = 0  # responses with a 4xx/5xx status
+    total: float = 0.0  # seconds
+    samples: deque = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES), repr=False)
+
+    def __str__(self) -> str:
+        return (
+            f"requests: {self.requests}, errors: {self.errors}, mean: {self.mean * 1000:.0f}ms, "
+            f"p50: {self.percentile(50) * 1000:.0f}ms, p95: {self.percentile(95) * 1000:.0f}ms"
+        )
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.requests if self.requests else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """Latency percentile over the most recent `LATENCY_SAMPLES` requests."""
+        if len(self.samples) < 2:
+            return self.samples[0] if self.samples else 0.0
+        return statistics.quantiles(self.samples, n=100, method="inclusive")[
+            min(max(round(percent) - 1, 0), 98)
+        ]
+
+    def record(self, seconds: float, error: bool = False):
+        self.requests += 1
+        self.errors += error
+        self.total += seconds
+        self.samples.append(seconds)
+
+
+_latency = {}
+_latency_lock = threading.Lock()
+
+
+def record_latency(response: requests.Response, *args, **kwargs):
+    """Response hook adding the request's latency to the stats of its host."""
+    host = urlsplit(response.url).netloc
+    with _latency_lock:
+        stats = _latency.setdefault(host, LatencyStats())
+        stats.record(response.elapsed.total_seconds(), error=response.status_code >= 400)
+
+
+def latency_stats() -> dict:
+    """Returns the `LatencyStats` of every host requested so far."""
+    with _latency_lock:
+        return dict(_latency)
+
+
+def reset_latency_stats():
+    with _latency_lock:
+        _latency.clear()
+
+
+def new_session(
+    timeout: float = None, retries: int = None, backoff: float = None, pool_size: int = None
+) -> requests.Session:
+    """Builds a `requests.Session` keeping connections alive per host. Unspecified settings are taken from
+    `cfg.pricing`.
+    """
+    timeout = config.cfg.pricing.timeout if timeout is None else timeout
+    retries = config.cfg.pricing.http_retries if retries is None else retries
+    backoff = config.cfg.pricing.backoff if backoff is None else backoff
+    pool_size = config.cfg.pricing.pool_size if pool_size is None else pool_size
+
+    retry = JitteredRetry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        timeout=timeout, max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    session.hooks["response"].append(record_latency)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    """Returns the session shared by all pricing providers, created on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = new_session()
+    return _session
+
+
+# %%
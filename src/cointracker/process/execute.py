@@ -5,7 +5,7 @@ from cointracker.objects.enumerated_values import TransactionType, OrderingStrat
 from cointracker.process.conversions import fiat_equivalent
 from cointracker.process.transact import execute_order
 from cointracker.process.wash import execute_washes
-from cointracker.settings.config import cfg
+from cointracker.settings import config
 
 
 def execute_orderbook(
@@ -13,9 +13,10 @@ def execute_orderbook(
 ) -> PoolRegistry:
     """
     Executes orders within `orderbook` according to the strategy in the configuration settings.
-    Optionally, an existing set of `pools` can be specified to pull in previous data.
+    Optionally, an existing set of `pools` can be specified to pull in previous data, in which case it is updated in place.
 
     """
+    cfg = config.cfg
     for order in orderbook:  # default orderbook is already sorted by ascending date
         pool_reg = execute_order(
             order, pools=pool_reg, strategy=cfg.processing.ordering_strategy
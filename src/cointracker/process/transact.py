@@ -11,13 +11,13 @@ from cointracker.process.conversions import fiat_equivalent
 def execute_order(
     order: Order, pools: PoolRegistry, strategy: OrderingStrategy
 ) -> PoolRegistry:
-    logging.debug(f"executing order {order} with strategy {strategy}")
-    logging.debug(f"---Initial pools list: {pools}")
+    logging.debug("executing order %s with strategy %s", order, strategy)
+    logging.debug("---Initial pools list: %s", pools)
     buy_txn, sell_txn = split_order(order=order)
 
     if (not sell_txn.asset.is_fiat) and (sell_txn.amount != 0.0):
         pools = execute_sell(sell_txn=sell_txn, pool_reg=pools, strategy=strategy)
-    logging.debug(f"---Pools list after execute_sell: {pools}")
+    logging.debug("---Pools list after execute_sell: %s", pools)
     # Add the buy pool to Pools after executing the sell side
 
     if (not buy_txn.asset.is_fiat) and (buy_txn.amount != 0.0):
@@ -32,7 +32,7 @@ def execute_order(
         if pools is None:
             pools = PoolRegistry(pools=[buy_pool])
         else:
-            pools = pools + buy_pool
+            pools.append(buy_pool)
 
     return pools
 
@@ -57,30 +57,34 @@ def split_order(order: Order):
 def execute_sell(
     sell_txn: Transaction, pool_reg: PoolRegistry, strategy: OrderingStrategy
 ) -> PoolRegistry:
-    print(
-        f"\nentered execute_sell of asset {sell_txn.asset.ticker} and amount {sell_txn.amount}:\n{pool_reg}"
-    )
-    """Executes the sale side of an order using the specified `strategy`."""
-    candidate_pools = pool_reg[sell_txn.asset.ticker].open_pools
-
-    if strategy == OrderingStrategy.FIFO:
-        candidate_pools.sort(by="sale", ascending=True)
-    elif strategy == OrderingStrategy.LIFO:
-        candidate_pools.sort(by="sale", ascending=False)
-
-    if candidate_pools.is_empty:
-        non_candidate_pools = pool_reg[sell_txn.asset.ticker].closed_pools
-        print(f"sell_txn:\n{sell_txn}")
-        print(
-            f"All pools with {sell_txn.asset}:\n{non_candidate_pools.to_df(kind='dict')}"
-        )
-        raise NoMatchingPoolError(
-            f"No matching pool found for {sell_txn.asset} on {sell_txn.date}"
-        )
+    """Executes the sale side of an order using the specified `strategy`. The sale is matched against the next open pool
+    until it is filled, each pool it empties closing and the rest of the sale carrying on to the next pool.
+    """
+    remaining_txn = sell_txn
+    while remaining_txn is not None:
+        matched_pool = pool_reg.next_open_pool(remaining_txn.asset.ticker, strategy=strategy)
+        if matched_pool is None:
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                non_candidate_pools = pool_reg[remaining_txn.asset.ticker].closed_pools
+                logging.debug("sell_txn:\n%s", remaining_txn)
+                logging.debug("All pools with %s:\n%s", remaining_txn.asset, non_candidate_pools.to_df(kind="dict"))
+            raise NoMatchingPoolError(
+                f"No matching pool found for {remaining_txn.asset} on {remaining_txn.date}"
+            )
+        remaining_txn = match_sell(remaining_txn, matched_pool=matched_pool, pool_reg=pool_reg)
+
+    return pool_reg
 
-    matched_pool = candidate_pools[0]
+
+def match_sell(
+    sell_txn: Transaction, matched_pool: Pool, pool_reg: PoolRegistry
+) -> Transaction:
+    """Sells as much of `sell_txn` as `matched_pool` holds, closing the pool. Returns the part of the sale still to be
+    matched, or `None` once it is filled.
+    """
+    remaining_txn = None
     remaining_sell_amount = sell_txn.amount - matched_pool.amount
-    logging.debug(f"beginning {remaining_sell_amount=}")
+    logging.debug("beginning remaining_sell_amount=%s", remaining_sell_amount)
 
     frac_remaining = abs((remaining_sell_amount) / sell_txn.amount)
     # if selling > 99% and the percent remaining is less than $1 round it to selling the entire pool
@@ -110,9 +114,6 @@ def execute_sell(
         matched_fraction = 1 - pool_excess_fraction
 
         excess_pool = matched_pool.copy()
-        print(
-            f"excess pool asset {excess_pool.asset}\nmatched_pool asset: {matched_pool.asset}"
-        )
         excess_pool.amount = matched_pool_excess_amount
         excess_pool.purchase_cost_fiat = (
             matched_pool.purchase_cost_fiat * pool_excess_fraction
@@ -133,7 +134,7 @@ def execute_sell(
         # ), f"sale amount ({sell_txn.amount}) should equal pool_amount * matched_fraction ({matched_pool.amount * matched_fraction})"
 
         excess_pool.set_dtypes()
-        pool_reg = pool_reg + excess_pool
+        pool_reg.append(excess_pool)
 
         matched_pool.amount = (
             sell_txn.amount
@@ -181,18 +182,6 @@ def execute_sell(
     matched_pool.set_dtypes()
     # logging.debug(f"matched_pool:\n{matched_pool}")
     # Update the pool registry with the new pool after the sale
-    idx = pool_reg.idx_for_id(matched_pool.id)
-    # logging.debug(
-    #     f"idx: {idx}\npool_reg.pools[idx] (id={pool_reg.pools[idx].id}):\n{pool_reg.pools[idx]}"
-    # )
-    pool_reg.pools[idx] = matched_pool
-
-    # Recursively repeat the process if there is a remaining transaction
-    if remaining_sell_amount > 0:
-        print(f"about to execute_sell: {pool_reg}")
-        print(f"{[pool for pool in pool_reg]}")
-        pool_reg = execute_sell(
-            sell_txn=remaining_txn, pool_reg=pool_reg, strategy=strategy
-        )
+    pool_reg.replace_by_id(matched_pool.id, matched_pool)
 
-    return pool_reg
+    return remaining_txn
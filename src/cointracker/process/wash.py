@@ -1,7 +1,8 @@
+import heapq
 import logging
 import numpy as np
 from tqdm import tqdm
-from cointracker.objects.pool import Pool, PoolRegistry
+from cointracker.objects.pool import Pool, PoolRegistry, WASH_WINDOW
 from cointracker.process.conversions import split_pool
 
 
@@ -17,22 +18,39 @@ def unmatched_washes(pool_reg: PoolRegistry) -> bool:
 
 def execute_washes(pool_reg: PoolRegistry) -> PoolRegistry:
     """
-    Executes orders within `orderbook` according to the strategy in the configuration settings.
-    Optionally, an existing set of `pools` can be specified to pull in previous data.
+    Applies the wash sale rule to the closed pools in `pool_reg` in a single sweep. Pools with a potential wash are handled
+    in order of sale date from a work queue. Remainders split off by `execute_wash`, and pools whose adjusted cost basis
+    turns their sale into a loss, are queued as they appear.
 
     """
+    queue = []  # (sale_date, position within pool_reg, pool) so that ties are handled in registry order
+    queued = set()
+
+    def enqueue(pool: Pool) -> None:
+        if pool.potential_wash and pool.id not in queued:
+            queued.add(pool.id)
+            heapq.heappush(queue, (pool.sale_date, pool_reg.idx_for_id(pool.id), pool))
+
+    for pool in pool_reg:
+        enqueue(pool)
+
     progress = tqdm()
-    while unmatched_washes(pool_reg=pool_reg):
+    while queue:
+        _, _, pool = heapq.heappop(queue)
+        queued.discard(pool.id)
+        if not pool.potential_wash:
+            continue
+
+        matched_pool = find_wash_match(pool_with_loss=pool, pool_reg=pool_reg)
+        if matched_pool is None:
+            # no replacement purchase can be added to its window later on, so the pool is done
+            continue
+
         progress.update()
-        candidate_pools = PoolRegistry(
-            [pool for pool in pool_reg if pool.potential_wash]
-        )
-        candidate_pools.sort(by="sale", ascending=True)
-        for pool in candidate_pools:
-            matched_pool = find_wash_match(pool_with_loss=pool, pool_reg=pool_reg)
-            if matched_pool is not None:
-                pool_reg = execute_wash(pool, matched_pool, pool_reg=pool_reg)
-                break  # break from the for loop and restart the while loop
+        size = len(pool_reg)
+        pool_reg = execute_wash(pool, matched_pool, pool_reg=pool_reg)
+        for changed_pool in [pool, matched_pool, *pool_reg[size:]]:
+            enqueue(changed_pool)
     return pool_reg
 
 
@@ -60,7 +78,7 @@ def execute_wash(
             pool=pool_that_triggered, retained_fraction=triggered_fraction
         )
 
-        pool_reg = pool_reg + pool_remainder
+        pool_reg.append(pool_remainder)
 
     elif remaining_loss_amount < 0:
         # the wash_pool has a greater_amount than the pool_that_triggered. Split wash_pool and apply the proportional
@@ -72,7 +90,7 @@ def execute_wash(
             pool=wash_pool, retained_fraction=wash_fraction
         )
 
-        pool_reg = pool_reg + pool_remainder
+        pool_reg.append(pool_remainder)
 
     # Update the wash_pool and pool_that_triggered
     wash_pool.wash.triggered_by_id = pool_that_triggered.id
@@ -87,10 +105,8 @@ def execute_wash(
     ), f"a partitioned wash sale should have no net gain (net_gain={wash_pool.net_gain})"
 
     # Update both pools within pool_reg
-    wash_idx = pool_reg.idx_for_id(wash_pool.id)
-    triggered_idx = pool_reg.idx_for_id(pool_that_triggered.id)
-    pool_reg[wash_idx] = wash_pool
-    pool_reg[triggered_idx] = pool_that_triggered
+    pool_reg.replace_by_id(wash_pool.id, wash_pool)
+    pool_reg.replace_by_id(pool_that_triggered.id, pool_that_triggered)
 
     return pool_reg
 
@@ -102,28 +118,17 @@ def find_wash_match(pool_with_loss: Pool, pool_reg: PoolRegistry) -> Pool:
         pool_with_loss.potential_wash
     ), "Trying to find a wash match for a pool in which `potential_wash` fails. Asset must be fungible, pool must have negative net gain, and can't already have been triggered as a wash sale"
     loss_sale_date = pool_with_loss.sale_date
-    pools_with_asset = pool_reg[pool_with_loss.asset.ticker]
-    pools_within_window = PoolRegistry(
-        pools=[
-            pool
-            for pool in pools_with_asset
-            if pool.within_wash_window(date=loss_sale_date, kind="purchase")
-        ]
+    # the first purchase within the window that hasn't already triggered a wash sale
+    # NOTE: including purchases at `loss_sale_date` has repercussions for trades on the same day with no timestamp
+    matched_pool = pool_reg.purchases.first_unpaired(
+        pool_with_loss.asset.ticker,
+        start=loss_sale_date,
+        end=loss_sale_date + WASH_WINDOW,
     )
-    pools_within_window.sort(by="purchase", ascending=True)
-    matched_pool = None
-
-    for pool in pools_within_window:
-        after_loss_sale = (
-            pool.purchase_date >= loss_sale_date
-        )  # NOTE: > vs >= has repercussions for trades on the same day with no timestamp
-        not_already_paired = pool.wash.triggers_id is None
-
-        if all((after_loss_sale, not_already_paired)):
-            logging.debug(
-                f"Purchase\n{pool} triggers the wash rule in pool {pool_with_loss}"
-            )
-            matched_pool = pool
-            break
+
+    if matched_pool is not None:
+        logging.debug(
+            f"Purchase\n{matched_pool} triggers the wash rule in pool {pool_with_loss}"
+        )
 
     return matched_pool
@@ -1,16 +1,23 @@
 from pathlib import Path
-import yaml
+import os
+import threading
 from dataclasses import dataclass, field
 from datetime import datetime
 from cointracker.objects.enumerated_values import OrderingStrategy
 
 DATE_FORMAT = "%Y/%m/%d"
+CONFIG_PATH = (Path(__file__).parents[1] / "settings/config.yaml").resolve()
 
 
 @dataclass
 class Paths:
     data: Path
     tests: Path
+    cache: Path = None  # compiled registries and indexes, `data` unless set
+
+    def __post_init__(self):
+        if self.cache is None:
+            self.cache = self.data
 
 
 @dataclass
@@ -24,16 +31,51 @@ class Processing:
     default_fiat: str = "USD"
 
 
+def default_rates() -> dict:
+    return {"coingecko": 0.5, "yahoo": 2.0, "coinbase": 3.0}
+
+
+def default_providers() -> list[str]:
+    return ["history", "coingecko", "yahoo"]
+
+
+def default_stablecoins() -> list[str]:
+    return ["USDT", "USDC", "BUSD", "DAI", "TUSD", "USDP", "GUSD"]
+
+
+@dataclass
+class Pricing:
+    cache: bool = True  # store fetched spot prices in `cache_file` and reuse them
+    infer_prices: bool = True  # fill spot prices that follow from the orderbook before looking any up
+    cache_file: Path = None  # defaults to `price_cache.sqlite` within `paths.data`
+    history_dir: Path = None  # offline price history, defaults to `history` within `paths.data`
+    rates: dict = field(default_factory=default_rates)  # requests per second per provider
+    max_in_flight: int = 4  # concurrent requests per provider
+    max_retries: int = 5  # retries after being rate limited
+    timeout: float = 30.0  # seconds
+    http_retries: int = 3  # retries after connection errors and server errors
+    backoff: float = 0.5  # seconds, base of the jittered exponential backoff between `http_retries`
+    pool_size: int = 10  # connections kept alive per host
+    providers: list[str] = field(default_factory=default_providers)  # tried in order
+    yahoo_mode: str = "chart"  # `chart` fetches whole ranges from the JSON API, `scrape` reads the history page per day
+    stablecoins: list[str] = field(default_factory=default_stablecoins)  # priced at 1 without a lookup
+    breaker_threshold: int = 3  # consecutive failures before a provider is skipped
+    breaker_reset: float = 300.0  # seconds before a skipped provider is tried again
+
+
 @dataclass
 class Config:
     paths: Paths
     processing: Processing
+    pricing: Pricing = field(default_factory=Pricing)
 
 
 def read_config(filepath: str = None) -> Config:
     """Reads the configuration file and returns a configuration object with the settings imported"""
+    import yaml
+
     if filepath is None:
-        filepath = (Path(__file__).parents[1] / "settings/config.yaml").resolve()
+        filepath = CONFIG_PATH
 
     # print(f"{filepath=}")
     with open(filepath) as file:
@@ -60,18 +102,62 @@ def read_config(filepath: str = None) -> Config:
     # We have the Paths now, so we can use this to import hte registry?
     processing = Processing(**processing)
 
-    config = Config(paths=paths, processing=processing)
+    pricing = settings.get("pricing", None) or {}
+    if pricing.get("cache_file"):
+        pricing["cache_file"] = (base_path / pricing["cache_file"]).resolve()
+    else:
+        pricing["cache_file"] = paths.data / "price_cache.sqlite"
+    if pricing.get("history_dir"):
+        pricing["history_dir"] = (base_path / pricing["history_dir"]).resolve()
+    else:
+        pricing["history_dir"] = paths.data / "history"
+    pricing["rates"] = {**default_rates(), **(pricing.get("rates") or {})}
+    pricing = Pricing(**pricing)
+
+    config = Config(paths=paths, processing=processing, pricing=pricing)
 
     return config
 
 
-def fiat_currencies() -> list[str]:
-    cfg = read_config()
-    fiat_registry_file = cfg.paths.data / "fiat_registry.yaml"
-    with open(fiat_registry_file, "r") as file:
+_snapshots = {}  # (loader name, path): (mtime_ns, size, value)
+_snapshots_lock = threading.Lock()
+
+
+def snapshot(path: Path, loader):
+    """Returns `loader(path)`, reusing the value loaded before until the file's mtime or size changes."""
+    path = Path(path)
+    stat = os.stat(path)
+    key = (loader.__name__, path)
+    with _snapshots_lock:
+        cached = _snapshots.get(key)
+        if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+            cached = _snapshots[key] = (stat.st_mtime_ns, stat.st_size, loader(path))
+    return cached[2]
+
+
+def current_config(filepath: str = None) -> Config:
+    """Returns the configuration read from `filepath`, only read again once the file changes."""
+    return snapshot(CONFIG_PATH if filepath is None else filepath, read_config)
+
+
+def read_fiat_registry(filepath: Path) -> frozenset[str]:
+    import yaml
+
+    with open(filepath, "r") as file:
         registry = yaml.safe_load(file)
 
-    return [registry[asset]["ticker"] for asset in registry]
+    return frozenset(registry[asset]["ticker"].upper() for asset in registry)
+
+
+def fiat_currencies() -> frozenset[str]:
+    """Returns the upper case tickers of the known fiat currencies, shared until the configuration or the fiat registry
+    changes.
+    """
+    return snapshot(current_config().paths.data / "fiat_registry.yaml", read_fiat_registry)
 
 
-cfg = read_config()
+def __getattr__(name: str):
+    # `cfg` is read on first use rather than on import, and follows changes to the configuration file
+    if name == "cfg":
+        return current_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
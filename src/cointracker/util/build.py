@@ -1,5 +1,4 @@
 # %%
-from tkinter import filedialog
 from pathlib import Path
 from cointracker.objects.asset import Asset, AssetRegistry
 from cointracker.util.parsing import (
@@ -13,6 +12,8 @@ def build_dummy_assets_from_orderbook_file(
     filepath: Path = None, sheet="Sheet1"
 ) -> AssetRegistry:
     if filepath is None:
+        from tkinter import filedialog
+
         filepath = filedialog.askopenfilename(
             title="Select pool registry file",
             filetypes=(("Excel files", "*.xlsx"), ("all files", "*.*")),
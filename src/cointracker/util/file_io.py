@@ -1,12 +1,16 @@
+import os
+import pickle
+import hashlib
+import threading
 import pandas as pd
-from tkinter import filedialog
 from pathlib import Path
 import warnings
 
 from cointracker.objects.asset import AssetRegistry, import_registry
 from cointracker.objects.pool import Pool, PoolRegistry, Wash
 from cointracker.objects.exceptions import IncorrectPoolFormat
-from cointracker.settings.config import cfg
+from cointracker.settings import config
+from cointracker.settings.config import fiat_currencies
 from cointracker.util.parsing import (
     parse_orderbook,
     orderbook_from_df,
@@ -19,29 +23,85 @@ from cointracker.util.parsing import (
 # -----Import Functions-----
 
 
-def load_asset_registry():
-    """Loads the `AssetRegistry` from the default configuration location."""
-    registry_file = cfg.paths.data / "token_registry.yaml"
-    token_registry = import_registry(filename=registry_file)
-    registry_file = cfg.paths.data / "nft_registry.yaml"
-    nft_registry = import_registry(filename=registry_file)
-    registry_file = cfg.paths.data / "fiat_registry.yaml"
-    fiat_registry = import_registry(filename=registry_file)
-    registry = token_registry + nft_registry + fiat_registry
-    registry = [item for item in registry if item is not None]
-    return AssetRegistry(registry)
+REGISTRY_FILES = ("token_registry.yaml", "nft_registry.yaml", "fiat_registry.yaml")
+REGISTRY_CACHE_VERSION = 1
+
+_asset_registries = {}  # data directory: ((file stats, fiat currencies), AssetRegistry)
+_asset_registries_lock = threading.Lock()
+
+
+def registry_cache_path(directory: Path, cache_dir: Path = None) -> Path:
+    """Where the registry compiled from `directory` is pickled, one file per data directory within `cache_dir`."""
+    cache_dir = Path(config.cfg.paths.cache if cache_dir is None else cache_dir)
+    key = hashlib.sha256(str(Path(directory).resolve()).encode()).hexdigest()[:16]
+    return cache_dir / f"asset_registry_{key}.pickle"
+
+
+def compile_asset_registry(directory: Path, cache_dir: Path = None) -> AssetRegistry:
+    """Returns the merged token, NFT and fiat registries within `directory`. The merged registry is pickled to
+    `cache_dir` (`paths.cache` by default), keyed by the hashes of the three YAML files, so they are only parsed again
+    once one of them changes. The fiat flags are set against the fiat currencies configured now, not those pickled.
+    """
+    directory = Path(directory)
+    cache_path = registry_cache_path(directory, cache_dir)
+    digests = {name: hashlib.sha256((directory / name).read_bytes()).hexdigest() for name in REGISTRY_FILES}
+    try:
+        with open(cache_path, "rb") as file:
+            cached = pickle.load(file)
+        if cached["version"] == REGISTRY_CACHE_VERSION and cached["digests"] == digests:
+            registry = cached["registry"]
+            registry.refresh_fiat()
+            return registry
+    except (OSError, EOFError, KeyError, TypeError, AttributeError, pickle.UnpicklingError):
+        pass
+
+    assets = []
+    for name in REGISTRY_FILES:
+        assets += [asset for asset in import_registry(filename=directory / name) if asset is not None]
+    registry = AssetRegistry(assets)
+    temporary = cache_path.with_suffix(".tmp")
+    try:
+        with open(temporary, "wb") as file:
+            pickle.dump(
+                {"version": REGISTRY_CACHE_VERSION, "digests": digests, "registry": registry},
+                file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(temporary, cache_path)
+    except OSError:
+        pass  # e.g. a read-only install, the registry still works in memory
+    return registry
+
+
+def load_asset_registry(directory: Path = None, cache_dir: Path = None) -> AssetRegistry:
+    """Loads the `AssetRegistry` from the default configuration location. The compiled registry is kept per process
+    until one of its files or the configured fiat currencies change, and each caller gets its own copy to add to.
+    """
+    directory = Path(config.cfg.paths.data if directory is None else directory)
+    stats = []
+    for name in REGISTRY_FILES:
+        stat = os.stat(directory / name)
+        stats.append((stat.st_mtime_ns, stat.st_size))
+    key = (stats, fiat_currencies())
+    with _asset_registries_lock:
+        cached = _asset_registries.get(directory)
+        if cached is None or cached[0] != key:
+            cached = _asset_registries[directory] = (key, compile_asset_registry(directory, cache_dir))
+    return cached[1].copy()
 
 
 def load_excel_orderbook(file: str, sheetname: str = "Sheet1"):
     """Loads an `Orderbook` from data saved in the .xlsx format from Excel."""
     registry = load_asset_registry()
     if file is None:
+        from tkinter import filedialog
+
         filename = filedialog.askopenfilename(
             title="Select order book transactions file",
             filetypes=(("Excel files", "*.xlsx"), ("all files", "*.*")),
         )
     else:
-        filename = cfg.paths.tests / file
+        filename = config.cfg.paths.tests / file
     order_df = parse_orderbook(filename, sheetname)
     orderbook = orderbook_from_df(order_df, registry=registry)
 
@@ -51,6 +111,8 @@ def load_excel_orderbook(file: str, sheetname: str = "Sheet1"):
 def load_excel_pool_registry(filepath: Path = None, sheetname: str = "Sheet1"):
     """Loads a `PoolRegistry` from data saved in the .xlsx format from Excel."""
     if filepath is None:
+        from tkinter import filedialog
+
         filepath = filedialog.askopenfilename(
             title="Select pool registry file",
             filetypes=(("Excel files", "*.xlsx"), ("all files", "*.*")),
@@ -67,6 +129,8 @@ def load_v1_purchase_pool(
 ) -> pd.DataFrame:
     """Loads the EOY Purchase Pools into a `PoolRegistry` object."""
     if filepath is None:
+        from tkinter import filedialog
+
         filepath = filedialog.askopenfilename(
             title="Select Purchase Pool file",
             filetypes=(("Excel files", "*.xlsx"), ("all files", "*.*")),
@@ -107,6 +171,8 @@ def load_v1_sale_pool(filepath: Path = None, sheetname: str = "Sheet1"):
     TODO: Can you get sale information from the Asset Pools that aren't active?
     """
     if filepath is None:
+        from tkinter import filedialog
+
         filepath = filedialog.askopenfilename(
             title="Select Sale Pool file",
             filetypes=(("Excel files", "*.xlsx"), ("all files", "*.*")),
@@ -203,7 +269,7 @@ def export_pool_reg(
 ) -> None:
     if ".xlsx" not in filename:
         filename = filename + ".xlsx"
-    filepath = cfg.paths.data / filename
+    filepath = config.cfg.paths.data / filename
 
     if consolidate:
         if kind not in ["sales_report", "irs", "tax", "8949"]:
@@ -8,13 +8,31 @@ from cointracker.objects.pool import Pool, PoolRegistry, Wash
 from cointracker.objects.asset import Asset, AssetRegistry
 from cointracker.objects.enumerated_values import TransactionType
 from cointracker.objects.exceptions import AssetNotFoundError
-from cointracker.pricing.getAssetPrice import getAssetPrice
-from cointracker.settings.config import cfg
-from cointracker.util.dialogue import register_asset_dialogue
+from cointracker.pricing.getAssetPrice import getAllAssetPrices
+from cointracker.pricing.price_cache import price_cache
+from cointracker.pricing.history_store import epoch_days, history_store
+from cointracker.settings import config
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"  # fast path when parsing orderbook and pool dates
+EPOCH_DAY = datetime.date(1970, 1, 1)
 
 
 def parse_orderbook(filename, sheet) -> pd.DataFrame:
     """Loads an orderbook from the input file and parses it, combining common orders within the same day."""
+    df, _ = load_orderbook(filename, sheet)
+    df = fill_missing_prices(df)
+    print("Prices updated")
+
+    df["Type"] = df["Type"].apply(lambda x: x.upper())  # enforce Type capitalization
+
+    return df
+
+
+def load_orderbook(filename, sheet) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Reads an orderbook for `parse_orderbook`: dates converted to UTC, orders consolidated and the spot prices that
+    follow from the orders themselves filled in, leaving only those that need a lookup missing. Returns the dataframe
+    and the report of the spot prices inferred, see `infer_missing_prices`.
+    """
     # if isinstance(filename, Path):
     #     filename = str(filename)
     xl_file = pd.ExcelFile(filename)
@@ -24,76 +42,13 @@ def parse_orderbook(filename, sheet) -> pd.DataFrame:
     # change all dates into timezone-aware datetime objects to be able to compare
     # NOTE: As (regular) Coinbase doesn't provide accurate timestamps, we have to
     # hope that things work assuming it's 12AM
-    for index, _ in df.iterrows():
-        dateObject = df.loc[index, "Date(UTC)"]
-        if not isinstance(dateObject, datetime.datetime):
-            dateObject = parser.parse(dateObject)  # parse the date to datetime
-
-        df.loc[index, "Date(UTC)"] = dateObject.replace(
-            tzinfo=datetime.timezone.utc
-        )  # convert to non-naive UTC
-
-        orderType = df.loc[index, "Type"]
-        orderType = orderType.upper()
+    df["Date(UTC)"] = normalize_utc_dates(df["Date(UTC)"])
 
     print("Order book loaded...dates converted to UTC")
 
     # Lets clean up the order book by combining small orders that occurred at
     # the same time and averaging their cost
-    partialOrderNum = 1
-    avg_1_spot_fiat = np.nan
-    avg_2_spot_fiat = np.nan
-    fee_spot_fiat = np.nan
-
-    for index, _ in df.iterrows():
-        # possible matches are orders occurring on the same day
-        potMergersMask = (
-            (
-                df["Date(UTC)"].apply(lambda x: x.strftime("%Y/%m/%d"))
-                == df.loc[index, "Date(UTC)"].strftime("%Y/%m/%d")
-            )
-            & (df["Market"] == df.loc[index, "Market"])
-            & (df["Type"] == df.loc[index, "Type"])
-            & (df["Fee Asset"] == df.loc[index, "Fee Asset"])
-        )
-        tempMergers = df[potMergersMask]
-        numPartialOrders = len(tempMergers)
-        if numPartialOrders > 1:  # nothing to merge if there's only one in the list
-            indicies = tempMergers.index  # get the indicies of all being merged
-            if (
-                not (tempMergers == tempMergers.loc[indicies[0], :]).all().all()
-            ):  # only need ot examine if not already averaged
-                # total = price*amount - fee*fee spot price?
-                netAmount = tempMergers["Amount"].sum()
-                # total = tempMergers['Total'].sum()
-                total = (
-                    tempMergers["Price"] * tempMergers["Amount"]
-                ).sum()  # may have been empty
-                netFee = tempMergers["Fee"].sum()
-                avgPrice = total / netAmount
-                # weight the avg price by the amounts
-                weights = tempMergers["Amount"] / tempMergers["Amount"].sum(min_count=1)
-                avg_1_spot_fiat = (
-                    tempMergers["Market 1 Fiat Spot Price"] * weights
-                ).sum(min_count=1)
-                avg_2_spot_fiat = (
-                    tempMergers["Market 2 Fiat Spot Price"] * weights
-                ).sum(min_count=1)
-                fee_spot_fiat = (
-                    tempMergers["Fee Asset Fiat Spot Price"] * weights
-                ).sum(min_count=1)
-
-                # set average values
-                df.loc[indicies, "Price"] = avgPrice
-                df.loc[indicies, "Amount"] = netAmount
-                # later becomes redundant... df.loc[index, 'Total'] = total
-                df.loc[indicies, "Fee"] = netFee
-                df.loc[indicies, "Market 1 Fiat Spot Price"] = avg_1_spot_fiat
-                df.loc[indicies, "Market 2 Fiat Spot Price"] = avg_2_spot_fiat
-                df.loc[indicies, "Fee Asset Fiat Spot Price"] = fee_spot_fiat
-
-                # duplicate to the other rows in tempMergers
-                df[potMergersMask] = df.loc[index, :]
+    df = consolidate_orders(df)
 
     # all partial orders are now duplicates, so drop them
     df = df.drop_duplicates()
@@ -108,63 +63,268 @@ def parse_orderbook(filename, sheet) -> pd.DataFrame:
 
     print("Orders consolidated")
 
-    # Get missing spot prices
-    dfmissing = df[
-        df.isnull().values
-    ].drop_duplicates()  # duplicates if multiple missing per row
-
-    # print(dfmissing)
-
-    for index, _ in dfmissing.iterrows():
-        asset1, asset2 = split_markets_str(dfmissing.loc[index, "Market"])
-        date = dfmissing.loc[index, "Date(UTC)"]
-        # replace each missing value in the row
-        if np.isnan(dfmissing.loc[index, "Market 1 Fiat Spot Price"]):
-            df.loc[index, "Market 1 Fiat Spot Price"] = getAssetPrice(
-                asset1, date
-            )  # df has same indicies
-        if np.isnan(dfmissing.loc[index, "Market 2 Fiat Spot Price"]):
-            df.loc[index, "Market 2 Fiat Spot Price"] = getAssetPrice(asset2, date)
-        if np.isnan(dfmissing.loc[index, "Fee Asset Fiat Spot Price"]):
-            df.loc[index, "Fee Asset Fiat Spot Price"] = getAssetPrice(
-                dfmissing.loc[index, "Fee Asset"], date
+    # Get missing spot prices, inferring what we can from the orders themselves first
+    inferred = pd.DataFrame(columns=["row", "column", "asset", "price", "via"])
+    if config.cfg.pricing.infer_prices:
+        df, inferred = infer_missing_prices(df)
+        if len(inferred) > 0:
+            counts = inferred.groupby("via").size().to_dict()
+            print(f"Inferred {len(inferred)} spot prices from the orders {counts}")
+
+    return df, inferred
+
+
+def infer_missing_prices(df: pd.DataFrame, max_passes: int = 3) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Fills in missing fiat spot prices that follow from the orderbook itself, without any provider lookup:
+    - `unit`: the default fiat currency and the configured stablecoins are worth 1
+    - `book`: the asset's spot price on the same (UTC) day, from the known spot prices and the `Price` of orders quoted
+      in fiat, averaged per (asset, day)
+    - `pair`: one leg of an order from the other leg's spot price and the order's `Price`
+    Passes repeat while they fill anything, up to `max_passes`. Returns the dataframe and a report of the values
+    inferred, one row per value with the row index, column, asset, price and how it was inferred (`via`).
+    """
+    cfg = config.cfg
+    unit_priced = {cfg.processing.default_fiat.upper(), *(ticker.upper() for ticker in cfg.pricing.stablecoins)}
+    spot_assets = spot_price_assets(df)
+    epoch = epoch_days(normalize_utc_dates(df["Date(UTC)"]))
+    price = df["Price"].where(df["Price"] > 0)
+    report = []
+
+    def fill(column: str, values: pd.Series, via: str) -> int:
+        mask = df[column].isna() & values.notna()
+        df.loc[mask, column] = values[mask]
+        report.append(
+            pd.DataFrame(
+                {
+                    "row": df.index[mask],
+                    "column": column,
+                    "asset": spot_assets[column][mask].to_numpy(),
+                    "price": values[mask].to_numpy(),
+                    "via": via,
+                }
             )
-    print("Prices updated")
+        )
+        return int(mask.sum())
+
+    for column, assets in spot_assets.items():
+        tickers = assets.where(has_asset(assets), "").astype(str).str.upper()  # e.g. no fee asset without fees
+        fill(column, pd.Series(np.where(tickers.isin(unit_priced), 1.0, np.nan), index=df.index), "unit")
+
+    for _ in range(max_passes):
+        filled = 0
+        # the spot price of market 1 follows from market 2's and vice versa
+        spot_1, spot_2 = df["Market 1 Fiat Spot Price"], df["Market 2 Fiat Spot Price"]
+        filled += fill("Market 1 Fiat Spot Price", price * spot_2, "pair")
+        filled += fill("Market 2 Fiat Spot Price", spot_1 / price, "pair")
+
+        # every spot price known on a day applies to the asset's other orders that day
+        observations = pd.concat(
+            [
+                pd.DataFrame({"asset": assets.to_numpy(), "day": epoch, "price": df[column].to_numpy()})
+                for column, assets in spot_assets.items()
+            ]
+        ).dropna()
+        observations = observations[observations["price"] > 0]
+        table = observations.groupby(["asset", "day"])["price"].mean()
+        for column, assets in spot_assets.items():
+            keys = pd.MultiIndex.from_arrays([assets, epoch])
+            filled += fill(column, pd.Series(table.reindex(keys).to_numpy(), index=df.index), "book")
+        if filled == 0:
+            break
+
+    inferred = pd.concat(report, ignore_index=True)
+    return df, inferred
+
+
+def spot_price_assets(df: pd.DataFrame) -> dict[str, pd.Series]:
+    """The asset each fiat spot price column prices, per row."""
+    markets = {market: split_markets_str(market) for market in df["Market"].unique()}
+    return {
+        "Market 1 Fiat Spot Price": df["Market"].map({m: pair[0] for m, pair in markets.items()}),
+        "Market 2 Fiat Spot Price": df["Market"].map({m: pair[1] for m, pair in markets.items()}),
+        "Fee Asset Fiat Spot Price": df["Fee Asset"],
+    }
+
+
+def has_asset(assets: pd.Series) -> np.ndarray:
+    """Rows naming an asset, i.e. neither NaN nor blank like the `Fee Asset` of orders without fees."""
+    return (assets.notna() & (assets.astype(str).str.strip() != "")).to_numpy()
+
+
+def fill_offline_prices(df: pd.DataFrame) -> pd.DataFrame:
+    """Fills in the missing fiat spot prices found in the offline `history_store()`, vectorized per asset."""
+    if "history" not in config.cfg.pricing.providers:
+        return df
+    epoch = epoch_days(normalize_utc_dates(df["Date(UTC)"]))
+    for column, assets in spot_price_assets(df).items():
+        missing = np.flatnonzero(df[column].isna().to_numpy())
+        if len(missing) == 0:
+            continue
+        values = df[column].to_numpy(dtype=float, copy=True)
+        missing_assets = assets.iloc[missing]
+        for asset, positions in missing_assets.groupby(missing_assets, sort=False).indices.items():
+            rows = missing[positions]
+            values[rows] = history_store().lookup(asset, epoch[rows])
+        df[column] = values
+    return df
 
-    df["Type"] = df["Type"].apply(lambda x: x.upper())  # enforce Type capitalization
 
+def missing_price_days(df: pd.DataFrame) -> dict[str, set[datetime.date]]:
+    """Returns the unique (UTC) days each asset still needs a fiat spot price on, across the three spot price columns."""
+    epoch = epoch_days(normalize_utc_dates(df["Date(UTC)"]))
+    pairs = []  # (asset, epoch day) still needed
+    for column, assets in spot_price_assets(df).items():
+        missing = df[column].isna().to_numpy() & has_asset(assets)
+        pairs.append(pd.DataFrame({"asset": assets[missing].to_numpy(), "day": epoch[missing]}))
+    pairs = pd.concat(pairs).drop_duplicates()
+
+    needed = {}
+    for asset, day in zip(pairs["asset"], pairs["day"]):
+        needed.setdefault(asset, set()).add(EPOCH_DAY + datetime.timedelta(days=int(day)))
+    return needed
+
+
+def fill_missing_prices(df: pd.DataFrame) -> pd.DataFrame:
+    """Fills in the missing fiat spot prices. Prices in the offline `history_store()` are looked up first, vectorized per
+    asset. The unique (asset, day) pairs still needed across the three spot price columns are then collected and
+    resolved together by `getAllAssetPrices`, so network requests scale with the number of assets rather than the number
+    of rows. Rows without an asset to price, like the fee of an order without one, are priced at 0.
+    """
+    df = fill_offline_prices(df)
+    for column, assets in spot_price_assets(df).items():
+        # nothing to price, e.g. the fee of an order without one
+        df.loc[df[column].isna().to_numpy() & ~has_asset(assets), column] = 0.0
+    needed = missing_price_days(df)
+    if len(needed) == 0:
+        return df
+
+    prices = pd.Series(
+        {
+            (asset, (day - EPOCH_DAY).days): price
+            for asset, asset_prices in getAllAssetPrices(needed).items()
+            for day, price in asset_prices.items()
+        },
+        dtype=float,
+    )
+    epoch = epoch_days(normalize_utc_dates(df["Date(UTC)"]))
+    for column, assets in spot_price_assets(df).items():
+        missing = df[column].isna() & has_asset(assets)
+        if missing.any():
+            keys = pd.MultiIndex.from_arrays([assets[missing], epoch[missing.to_numpy()]])
+            df.loc[missing, column] = prices.reindex(keys).to_numpy()
+    if price_cache() is not None:
+        print(f"...{price_cache().stats}")
+
+    return df
+
+
+def consolidate_orders(df: pd.DataFrame) -> pd.DataFrame:
+    """Combines partial orders with the same `Market`, `Type` and `Fee Asset` that occurred on the same (UTC) day. Every
+    row of such a group is overwritten by the group's first row with the amounts and fees summed and the price and fiat
+    spot prices averaged, weighted by amount, so that the duplicates can then be dropped. Groups whose rows are already
+    identical are left unchanged.
+    """
+    day = normalize_utc_dates(df["Date(UTC)"]).dt.normalize()
+    keys = [day, df["Market"], df["Type"], df["Fee Asset"]]
+    grouped = df.groupby(keys, sort=False, dropna=True)
+
+    # rows with a missing key are never merged and have a NaN group size
+    group_size = grouped["Amount"].transform("size")
+    identical = pd.Series(True, index=df.index)
+    for column in df.columns:
+        identical &= grouped[column].transform("nunique", dropna=False) == 1
+    to_merge = (group_size > 1) & ~identical
+    if not to_merge.any():
+        return df
+
+    net_amount = grouped["Amount"].transform("sum")
+    total = (df["Price"] * df["Amount"]).groupby(keys, sort=False).transform("sum")
+    net_fee = grouped["Fee"].transform("sum")
+    # weight the avg price by the amounts
+    weights = df["Amount"] / grouped["Amount"].transform("sum", min_count=1)
+    spot_columns = [
+        "Market 1 Fiat Spot Price",
+        "Market 2 Fiat Spot Price",
+        "Fee Asset Fiat Spot Price",
+    ]
+    avg_spot_fiat = {
+        column: (df[column] * weights)
+        .groupby(keys, sort=False)
+        .transform("sum", min_count=1)
+        for column in spot_columns
+    }
+
+    positions = pd.Series(np.arange(len(df)), index=df.index)
+    first_positions = positions.groupby(keys, sort=False).transform("min")
+
+    merged = df.iloc[first_positions[to_merge].astype(int)].copy()
+    merged.index = df.index[to_merge]
+    merged["Price"] = total[to_merge] / net_amount[to_merge]
+    merged["Amount"] = net_amount[to_merge]
+    merged["Fee"] = net_fee[to_merge]
+    for column in spot_columns:
+        merged[column] = avg_spot_fiat[column][to_merge]
+
+    df = df.copy()
+    df.loc[to_merge] = merged
     return df
 
 
 def orderbook_from_df(dataframe: pd.DataFrame, registry: AssetRegistry):
-    orderbook = []
-    for _, row in dataframe.iterrows():
-        asset1, asset2 = split_markets(row["Market"], registry=registry)
-        date = str_to_datetime_utc(row["Date(UTC)"])
-        orderbook.append(
-            Order(
-                date=date,
-                market_1=asset1,
-                market_2=asset2,
-                kind=TransactionType.from_str(row["Type"]),
-                price=row["Price"],
-                amount=row["Amount"],
-                # total is a property, not taken from the dataframe
-                fee=row["Fee"],
-                fee_asset=row["Fee Asset"],
-                spot_1_fiat=row["Market 1 Fiat Spot Price"],
-                spot_2_fiat=row["Market 2 Fiat Spot Price"],
-                fee_spot_fiat=row["Fee Asset Fiat Spot Price"],
-            )
+    """Builds the `OrderBook` column-wise. Each distinct market and order type is only looked up once."""
+    markets = {
+        market: split_markets(market, registry=registry)
+        for market in dataframe["Market"].unique()
+    }
+    kinds = {kind: TransactionType.from_str(kind) for kind in dataframe["Type"].unique()}
+    columns = zip(
+        normalize_utc_dates(dataframe["Date(UTC)"]),  # no-op if already normalized
+        dataframe["Market"].map(markets),
+        dataframe["Type"].map(kinds),
+        dataframe["Price"].tolist(),
+        dataframe["Amount"].tolist(),
+        # total is a property, not taken from the dataframe
+        dataframe["Fee"].tolist(),
+        dataframe["Fee Asset"].tolist(),
+        dataframe["Market 1 Fiat Spot Price"].tolist(),
+        dataframe["Market 2 Fiat Spot Price"].tolist(),
+        dataframe["Fee Asset Fiat Spot Price"].tolist(),
+    )
+    orderbook = [
+        Order(
+            date=date,
+            market_1=asset1,
+            market_2=asset2,
+            kind=kind,
+            price=price,
+            amount=amount,
+            fee=fee,
+            fee_asset=fee_asset,
+            spot_1_fiat=spot_1_fiat,
+            spot_2_fiat=spot_2_fiat,
+            fee_spot_fiat=fee_spot_fiat,
         )
+        for (
+            date,
+            (asset1, asset2),
+            kind,
+            price,
+            amount,
+            fee,
+            fee_asset,
+            spot_1_fiat,
+            spot_2_fiat,
+            fee_spot_fiat,
+        ) in columns
+    ]
 
     return OrderBook(orders=orderbook)
 
 
 def set_pool_reg_df_dtypes(dataframe: pd.DataFrame) -> pd.DataFrame:
     """Handles conversion of values within the dataframe to their correct data type."""
-    dataframe.purchase_date = pd.to_datetime(dataframe.purchase_date)
-    dataframe.sale_date = pd.to_datetime(dataframe.sale_date)
+    dataframe.purchase_date = normalize_utc_dates(dataframe.purchase_date)
+    dataframe.sale_date = normalize_utc_dates(dataframe.sale_date)
     dataframe = dataframe.replace({pd.NaT: None, pd.NA: None, float("nan"): None})
     dataframe.id = dataframe.id.apply(clean_uuid)
     dataframe.triggered_by_id = dataframe.triggered_by_id.apply(
@@ -205,7 +365,9 @@ def pool_reg_from_df(dataframe: pd.DataFrame, asset_reg: AssetRegistry):
         except AssetNotFoundError(
             f"Asset {pool_dict['asset']} not found. Please enter asset details"
         ):
-            asset_reg.assets.append(Asset(**register_asset_dialogue()))
+            from cointracker.util.dialogue import register_asset_dialogue
+
+            asset_reg.append(Asset(**register_asset_dialogue()))
         wash_dict = {}
         wash_dict["triggered_by_id"] = pool_dict.pop("triggered_by_id")
         wash_dict["triggers_id"] = pool_dict.pop("triggers_id")
@@ -239,7 +401,9 @@ def pool_reg_from_v1_df(dataframe: pd.DataFrame, asset_reg: AssetRegistry):
         except AssetNotFoundError(
             f"Asset {pool_dict['asset']} not found. Please enter asset details"
         ):
-            asset_reg.assets.append(Asset(**register_asset_dialogue()))
+            from cointracker.util.dialogue import register_asset_dialogue
+
+            asset_reg.append(Asset(**register_asset_dialogue()))
         wash_dict = {}
         wash_dict["triggered_by_id"] = pool_dict.pop("triggered_by_id")
         wash_dict["triggers_id"] = pool_dict.pop("triggers_id")
@@ -303,6 +467,19 @@ def pool_reg_by_type(pool_reg: PoolRegistry) -> dict:
     return pool_dict
 
 
+def normalize_utc_dates(dates: pd.Series, format: str = DATE_FORMAT) -> pd.Series:
+    """Converts a column of dates (strings or datetimes) into timezone aware UTC datetimes in a single vectorized step.
+    Naive dates are taken to be in UTC and dates with another timezone are converted to UTC. Strings are first parsed
+    with `format`, falling back to inferring the format if any of them don't match it.
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return pd.to_datetime(dates, utc=True)
+    try:
+        return pd.to_datetime(dates, utc=True, format=format)
+    except (ValueError, TypeError):
+        return pd.to_datetime(dates, utc=True)
+
+
 def str_to_datetime_utc(string: str) -> datetime.datetime:
     """Converts a string to timezone aware utc time"""
 
@@ -384,7 +561,7 @@ def convert_v1_ids(
 def split_markets_str(markets: str):
     if "-" not in markets:
         asset1 = markets
-        asset2 = cfg.processing.default_fiat.upper()
+        asset2 = config.cfg.processing.default_fiat.upper()
     else:
         asset1, asset2 = markets.split("-")
 
@@ -0,0 +1,84 @@
+# %%
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from cointracker.pricing.price_cache import PriceCache, price_cache
+from cointracker.pricing.providers import ProviderChain, price_chain
+from cointracker.settings import config
+from cointracker.util.parsing import fill_offline_prices, load_orderbook, missing_price_days
+
+
+@dataclass
+class PrefetchResult:
+    needed: int = 0  # (asset, day) spot prices the orderbook needs looked up
+    cached: int = 0  # of those already in the cache before the run
+    fetched: int = 0
+    unpriced: int = 0  # no provider had them, these will be looked up again by the next run
+    failed: list[str] = field(default_factory=list)  # assets whose lookup raised
+
+    def __repr__(self) -> str:
+        return (
+            f"Prefetched {self.fetched} prices, {self.cached} of {self.needed} were already cached, "
+            f"{self.unpriced} unpriced, {len(self.failed)} assets failed"
+        )
+
+
+def prefetch_prices(
+    filename,
+    sheet: str = "Sheet1",
+    cache: PriceCache = None,
+    chain: ProviderChain = None,
+    workers: int = None,
+) -> PrefetchResult:
+    """Warms the price cache for the orderbook in `filename`, so that parsing it afterwards doesn't wait on the network.
+    The orderbook is read as `parse_orderbook` reads it, and every (asset, day) whose spot price isn't known from the
+    orders or the offline history is looked up through the `chain`, one asset per task with at most `workers` assets in
+    flight. Each asset's prices are written to the `cache` as soon as they arrive, and days already cached are skipped,
+    so an interrupted run picks up where it left off.
+    """
+    cache = price_cache() if cache is None else cache
+    if cache is None:
+        raise ValueError("Prefetching needs the price cache, set `pricing.cache` to True")
+    chain = price_chain() if chain is None else chain
+    workers = config.cfg.pricing.max_in_flight if workers is None else workers
+
+    df, _ = load_orderbook(filename, sheet)
+    needed = missing_price_days(fill_offline_prices(df))
+    needed = {asset: days for asset, days in needed.items() if asset.upper() not in chain.unit_priced}
+    result = PrefetchResult(needed=sum(len(days) for days in needed.values()))
+    remaining = {}
+    for asset, days in needed.items():
+        days = sorted(day for day in days if cache.get(asset, day) is None)
+        if len(days) > 0:
+            remaining[asset] = days
+    result.cached = result.needed - sum(len(days) for days in remaining.values())
+    print(f"{result.cached} of {result.needed} prices cached...fetching {len(remaining)} assets")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        tasks = {executor.submit(chain.prices, {asset: days}, cache): asset for asset, days in remaining.items()}
+        for done, task in enumerate(as_completed(tasks), start=1):
+            asset = tasks[task]
+            try:
+                prices = task.result()[asset]
+            except Exception as error:
+                result.failed.append(asset)
+                print(f"...could not prefetch {asset} ({error!r})")
+                continue
+            found = sum(price != 0 for price in prices.values())
+            result.fetched += found
+            result.unpriced += len(prices) - found
+            print(f"...{asset}: {found} of {len(prices)} days ({done}/{len(tasks)} assets)")
+
+    print(result)
+    return result
+
+
+# %%
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Fetch the spot prices an orderbook needs into the price cache.")
+    arg_parser.add_argument("orderbook", help="orderbook Excel file")
+    arg_parser.add_argument("--sheet", default="Sheet1", help="sheet of the orderbook")
+    arg_parser.add_argument("--workers", type=int, help="assets fetched concurrently")
+    args = arg_parser.parse_args()
+    prefetch_prices(args.orderbook, sheet=args.sheet, workers=args.workers)
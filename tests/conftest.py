@@ -1,6 +1,18 @@
 import pytest
 from cointracker.util.file_io import load_excel_orderbook
 from cointracker.process.transact import split_order
+from cointracker.settings import config
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_dir(tmp_path_factory):
+    """Writes the compiled asset registries and CoinGecko indexes to a temporary directory rather than the package
+    data.
+    """
+    paths = config.cfg.paths
+    cache, paths.cache = paths.cache, tmp_path_factory.mktemp("cache")
+    yield paths.cache
+    paths.cache = cache
 
 
 @pytest.fixture(scope="session")
@@ -0,0 +1,69 @@
+from cointracker.objects.asset import Asset, AssetRegistry, import_registry
+from cointracker.objects import asset as asset_module
+from cointracker.util import file_io
+import pytest
+import yaml
+
+ETH = Asset(name="Ethereum", ticker="ETH", fungible=True, decimals=18)
+USD = Asset(name="US Dollar", ticker="USD", fungible=True, decimals=2)
+
+
+def test_registry_lookups_are_indexed() -> None:
+    registry = AssetRegistry([ETH, USD])
+    assert registry["eth"] is ETH, "Lookups are case insensitive"
+    assert registry["us dollar"] is USD, "Assets are found by name too"
+    with pytest.raises(ValueError):
+        registry["ADA"]
+
+    wrapped = Asset(name="Wrapped Ether", ticker="eth", fungible=True, decimals=18)
+    registry = registry + wrapped
+    assert registry["ETH"] is wrapped, "The last asset registered under a key wins"
+    assert registry["Ethereum"] is ETH
+
+    ada = Asset(name="Cardano", ticker="ADA", fungible=True, decimals=6)
+    registry.append(ada)
+    assert "ada" in registry and registry["Cardano"] is ada
+    registry[0] = ada
+    assert "Ethereum" not in registry, "Replaced assets are reindexed"
+
+
+def test_fiat_flag_is_fixed_when_registered() -> None:
+    registry = AssetRegistry([Asset(name="Ethereum", ticker="ETH", fungible=True), USD])
+    assert registry.fiat.assets == [USD]
+    assert USD.to_dict() == {"name": "US Dollar", "ticker": "USD", "fungible": True, "decimals": 2}
+    assert Asset(name="Euro", ticker="eur", fungible=True, decimals=2).is_fiat, "Unregistered assets work it out"
+
+
+def test_compiled_registry_is_reused(tmp_path, monkeypatch) -> None:
+    for name, ticker in [("token_registry.yaml", "ETH"), ("nft_registry.yaml", None), ("fiat_registry.yaml", "USD")]:
+        assets = {ticker: {"name": ticker.lower(), "ticker": ticker, "decimals": 2}} if ticker else {}
+        (tmp_path / name).write_text(yaml.dump(assets))
+    parsed = []
+    monkeypatch.setattr(file_io, "import_registry", lambda filename: parsed.append(filename) or import_registry(filename))
+
+    registry = file_io.load_asset_registry(tmp_path)
+    assert [asset.ticker for asset in registry] == ["ETH", "USD"] and registry["USD"].is_fiat
+    assert len(parsed) == 3
+    registry.append(Asset(name="Cardano", ticker="ADA", fungible=True, decimals=6))
+    assert len(file_io.load_asset_registry(tmp_path)) == 2, "Callers get their own copy"
+
+    file_io._asset_registries.clear()
+    assert len(file_io.load_asset_registry(tmp_path)) == 2
+    assert len(parsed) == 3, "A new process reads the compiled registry instead of the YAML files"
+
+    (tmp_path / "nft_registry.yaml").write_text(yaml.dump({"APE": {"name": "ape", "ticker": "APE", "decimals": 0}}))
+    assert "APE" in file_io.load_asset_registry(tmp_path), "Changed files are compiled again"
+    assert len(parsed) == 6
+    assert not any(tmp_path.glob("*.pickle")), "The compiled registry goes to the cache directory"
+
+
+def test_compiled_registry_follows_the_fiat_currencies(tmp_path, monkeypatch) -> None:
+    for name, ticker in [("token_registry.yaml", "ETH"), ("nft_registry.yaml", None), ("fiat_registry.yaml", "USD")]:
+        assets = {ticker: {"name": ticker.lower(), "ticker": ticker, "decimals": 2}} if ticker else {}
+        (tmp_path / name).write_text(yaml.dump(assets))
+    assert not file_io.load_asset_registry(tmp_path)["ETH"].is_fiat
+
+    monkeypatch.setattr(asset_module, "fiat_currencies", lambda: frozenset({"ETH"}))
+    monkeypatch.setattr(file_io, "fiat_currencies", lambda: frozenset({"ETH"}))
+    registry = file_io.load_asset_registry(tmp_path)
+    assert registry["ETH"].is_fiat and not registry["USD"].is_fiat, "Pickled fiat flags are set again"
@@ -0,0 +1,98 @@
+from cointracker.objects.exceptions import UnlistedAssetError
+from cointracker.pricing.coinbase_api import MAX_CANDLES, CoinbaseProvider
+from cointracker.pricing.history_store import HistoryStore, epoch_days
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import datetime
+import pytest
+import json
+
+UTC = datetime.timezone.utc
+
+
+class CandleHandler(BaseHTTPRequestHandler):
+    """Stands in for the Coinbase candles endpoint. Every candle opens at its start time divided by its granularity
+    and closes one higher. Only `BTC-USD` is listed.
+    """
+
+    requests = []
+    delay = 0.0  # seconds before answering
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path != "/products/BTC-USD/candles":
+            self.send_response(404)
+            body = b'{"message": "NotFound"}'
+        else:
+            granularity = int(query["granularity"])
+            start = int(datetime.datetime.fromisoformat(query["start"]).timestamp())
+            end = int(datetime.datetime.fromisoformat(query["end"]).timestamp())
+            times = range(end // granularity * granularity, start - 1, -granularity)  # newest first
+            candles = [[t, 0, 0, t / granularity, t / granularity + 1, 1] for t in times]
+            self.requests.append(len(candles))
+            self.send_response(200)
+            body = json.dumps(candles).encode()
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def coinbase(tmp_path):
+    CandleHandler.requests = []
+    CandleHandler.delay = 0.0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), CandleHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield CoinbaseProvider(
+        store=HistoryStore(tmp_path / "history"), base_url=f"http://127.0.0.1:{httpd.server_address[1]}"
+    )
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_daily_candles_are_chunked_and_stored(coinbase) -> None:
+    start = datetime.datetime(1970, 1, 1, tzinfo=UTC) + datetime.timedelta(days=60 * MAX_CANDLES)
+    end = start + datetime.timedelta(days=699)  # chunks are aligned to multiples of 300 days since the epoch
+    candles = coinbase.candles("BTC-USD", start, end)
+
+    assert len(candles) == 700
+    assert len(CandleHandler.requests) == 3, "700 days should take three aligned chunks"
+    assert max(CandleHandler.requests) <= MAX_CANDLES
+    assert candles.open[0] == start.timestamp() // 86400
+
+    day = datetime.date(2020, 6, 1)
+    assert coinbase.price("BTC", day) == epoch_days(day)[0], "Daily prices are the candle opens"
+    assert len(CandleHandler.requests) == 3, "Cached chunks aren't fetched again"
+    assert coinbase.store.lookup("BTC", epoch_days(day))[0] == epoch_days(day)[0], "Daily candles are saved"
+
+
+def test_concurrent_lookups_fetch_each_chunk_once(coinbase) -> None:
+    CandleHandler.delay = 0.1
+    start = datetime.datetime(1970, 1, 1, tzinfo=UTC) + datetime.timedelta(days=60 * MAX_CANDLES)
+    end = start + datetime.timedelta(days=699)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        lengths = list(executor.map(lambda _: len(coinbase.candles("BTC-USD", start, end)), range(8)))
+
+    assert lengths == [700] * 8, "Lookups waiting on another's chunks still see them"
+    assert len(CandleHandler.requests) == 3, "Chunks in flight aren't requested again"
+
+
+def test_intraday_lookup_and_unlisted_products(coinbase) -> None:
+    order_time = datetime.datetime(2022, 4, 7, 18, 6, 44, tzinfo=UTC)
+    hour = datetime.datetime(2022, 4, 7, 18, tzinfo=UTC).timestamp() // 3600
+    assert coinbase.price_at("BTC", order_time) == hour, "The hourly candle containing the order is used"
+    assert coinbase.price_at("BTC", order_time + datetime.timedelta(minutes=60)) == hour + 1
+    assert len(CandleHandler.requests) == 1, "Nearby orders share a chunk"
+
+    with pytest.raises(UnlistedAssetError):
+        coinbase.price_at("NOPE", order_time)
+    with pytest.raises(ValueError):
+        coinbase.price_at("BTC", order_time, granularity=120)
@@ -0,0 +1,38 @@
+from cointracker.pricing.coingecko_ids import coingecko_id, coingecko_index, sidecar_path
+import json
+import os
+
+
+def test_index_resolves_collisions_deterministically(tmp_path) -> None:
+    path = tmp_path / "CoinGeckoIDs.json"
+    coins = [
+        {"id": "ethereum-wormhole", "symbol": "eth", "name": "Ethereum (Wormhole)"},
+        {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+        {"id": "shiba-inu-bridged", "symbol": "SHIB", "name": "Bridged Shiba Inu"},
+        {"id": "shiba-inu", "symbol": "shib", "name": "Shiba Inu"},
+        {"id": "cardano", "symbol": "ada", "name": "Cardano"},
+    ]
+    path.write_text(json.dumps(coins))
+
+    index = coingecko_index(path)
+    assert coingecko_id("ETH", path) == "ethereum", "Well-known symbols use their preferred id"
+    assert coingecko_id("shib", path) == "shiba-inu", "Otherwise the shortest id wins"
+    assert coingecko_id("nope", path) is None
+    assert index.collisions == {
+        "eth": ["ethereum", "ethereum-wormhole"],
+        "shib": ["shiba-inu", "shiba-inu-bridged"],
+    }
+    assert sidecar_path(path).exists(), "A pickle sidecar is written to the cache directory"
+    assert not any(tmp_path.glob("*.pickle")), "Nothing is written next to the JSON file"
+    assert coingecko_index(path) is index, "The index is memoized while the file is unchanged"
+
+
+def test_index_rebuilds_when_the_json_changes(tmp_path) -> None:
+    path = tmp_path / "CoinGeckoIDs.json"
+    path.write_text(json.dumps({"ada": "cardano"}))  # the older {symbol: id} format
+    assert coingecko_id("ADA", path) == "cardano"
+
+    path.write_text(json.dumps({"ada": "cardano", "btc": "bitcoin"}))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert coingecko_id("BTC", path) == "bitcoin", "A newer JSON file is picked up"
@@ -0,0 +1,26 @@
+from cointracker.settings.config import fiat_currencies, snapshot
+import os
+
+
+def test_snapshot_reloads_only_when_the_file_changes(tmp_path) -> None:
+    loads = []
+
+    def read_tickers(path) -> list[str]:
+        loads.append(path)
+        return path.read_text().split()
+
+    path = tmp_path / "tickers.txt"
+    path.write_text("USD EUR")
+    assert snapshot(path, read_tickers) == ["USD", "EUR"]
+    assert snapshot(path, read_tickers) is snapshot(path, read_tickers)
+    assert len(loads) == 1, "An unchanged file shouldn't be read again"
+
+    path.write_text("USD EUR GBP")
+    os.utime(path, ns=(0, 0))
+    assert snapshot(path, read_tickers) == ["USD", "EUR", "GBP"], "A changed file should be read again"
+    assert len(loads) == 2
+
+
+def test_fiat_currencies_are_shared() -> None:
+    assert fiat_currencies() is fiat_currencies()
+    assert "USD" in fiat_currencies()
@@ -0,0 +1,104 @@
+from cointracker.pricing.fetch import TokenBucket, fetch_all
+from cointracker.pricing.session import latency_stats, new_session, reset_latency_stats
+from cointracker.pricing import getCoinGeckoPrice
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import datetime
+import logging
+import pytest
+import time
+
+
+class RateLimitedHandler(BaseHTTPRequestHandler):
+    """Answers the first request to each path with a 429 and `Retry-After: 0` (a 500 for paths under `/flaky`), later
+    ones with the path as JSON. Connections are kept alive and their client ports recorded.
+    """
+
+    protocol_version = "HTTP/1.1"
+    seen = set()
+    ports = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            first = self.path not in self.seen
+            self.seen.add(self.path)
+            self.ports.append(self.client_address[1])
+        if first:
+            self.send_response(500 if self.path.startswith("/flaky") else 429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            body = f'{{"path": "{self.path}"}}'.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    RateLimitedHandler.seen = set()
+    RateLimitedHandler.ports = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RateLimitedHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_token_bucket_spacing() -> None:
+    bucket = TokenBucket(rate=10.0, capacity=3)
+    waits = [bucket.reserve() for _ in range(5)]
+    assert waits[:3] == [0.0, 0.0, 0.0], "A full bucket allows a burst of `capacity` requests"
+    assert waits[3] == pytest.approx(0.1, abs=0.01)
+    assert waits[4] == pytest.approx(0.2, abs=0.01)
+
+    bucket.throttle(delay=1.0)
+    assert bucket.rate == 5.0, "Being rate limited halves the rate"
+    assert bucket.reserve() > 0.99, "Requests are held back for the `Retry-After` delay"
+    bucket.recover()
+    assert bucket.rate == 6.0
+
+
+def test_fetch_all_retries_rate_limited_requests(server) -> None:
+    bucket = TokenBucket(rate=200.0, capacity=5)
+    queries = [{"url": f"{server}/coins/{i}"} for i in range(6)]
+
+    start = time.monotonic()
+    responses = fetch_all("local", queries, max_in_flight=3, bucket=bucket)
+    assert time.monotonic() - start < 5, "`Retry-After: 0` should not cause a fixed sleep"
+
+    assert [response.status_code for response in responses] == [200] * 6
+    assert [response.json()["path"] for response in responses] == [
+        f"/coins/{i}" for i in range(6)
+    ], "Responses are returned in the order of the queries"
+    assert bucket.rate < bucket.max_rate, "The 429s should have slowed the bucket down"
+
+
+def test_session_keeps_connections_alive_and_retries(server) -> None:
+    reset_latency_stats()
+    session = new_session(retries=2, backoff=0)
+    responses = [session.get(f"{server}/flaky/{i}") for i in range(3)]
+
+    assert [response.status_code for response in responses] == [200] * 3, "Server errors are retried"
+    assert len(set(RateLimitedHandler.ports)) == 1, "Every request should reuse the same connection"
+    stats = latency_stats()[server.split("//")[1]]
+    assert stats.requests == 3 and stats.errors == 0
+    assert 0 < stats.percentile(50) <= stats.percentile(95)
+
+
+def test_coingecko_price_survives_failed_requests(monkeypatch, caplog) -> None:
+    def unreachable(provider, url, **kwargs):
+        raise ConnectionError("unreachable")
+
+    monkeypatch.setattr(getCoinGeckoPrice, "fetch", unreachable)
+    with caplog.at_level(logging.WARNING):
+        assert getCoinGeckoPrice.getCoinGeckoPrice("ETH", datetime.datetime(2022, 1, 29)) == 0
+    assert "unreachable" in caplog.text, "The request's own error should be reported"
@@ -0,0 +1,59 @@
+from cointracker.pricing.history_store import HistoryStore, PriceHistory, epoch_days
+from cointracker.pricing.providers import HistoryProvider, ProviderChain
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import datetime
+
+
+def write_csv(path, rows: list[str], header: str = "Date,Open,High,Low,Close") -> None:
+    path.write_text("\n".join([header, *rows]) + "\n")
+
+
+def test_import_and_lookup(tmp_path) -> None:
+    write_csv(tmp_path / "ETH-USD.csv", ["2022-01-03,30,31,29,31", "2022-01-01,10,11,9,11", "2022-01-02,20,21,19,21"])
+    store = HistoryStore(tmp_path / "history")
+    assert store.import_csv(tmp_path / "ETH-USD.csv") == 3
+    assert store.tickers == ["ETH"], "The ticker is taken from the file name"
+
+    days = epoch_days([datetime.date(2022, 1, 2), datetime.date(2022, 1, 5), datetime.date(2021, 12, 31)])
+    prices = store.lookup("eth", days)
+    assert prices[0] == 20.0
+    assert np.isnan(prices[1:]).all(), "Days without history are `nan`"
+    assert store.lookup("eth", days[:1], field="close")[0] == 21.0
+
+    write_csv(tmp_path / "update.csv", ["1643932800000,40.0", "1641081600000,25.0"], header="snapped_at,price")
+    store.import_csv(tmp_path / "update.csv", ticker="ETH")
+    history = HistoryStore(tmp_path / "history").history("ETH")
+    assert history.days.tolist() == epoch_days(
+        [datetime.date(2022, 1, day) for day in [1, 2, 3]] + [datetime.date(2022, 2, 4)]
+    ).tolist(), "Imports are merged into the sorted history"
+    assert history.open.tolist() == [10.0, 25.0, 30.0, 40.0], "Newer imports replace existing days"
+
+
+def test_history_provider_in_chain(tmp_path) -> None:
+    write_csv(tmp_path / "ADA.csv", ["2022-01-01,1.5,1.6,1.4,1.6", "2022-01-02,1.7,1.8,1.6,1.8"])
+    store = HistoryStore(tmp_path / "history")
+    store.import_csv(tmp_path / "ADA.csv")
+    chain = ProviderChain([HistoryProvider(store)])
+
+    days = [datetime.date(2022, 1, 1), datetime.date(2022, 1, 2)]
+    assert chain.prices({"ADA": days}) == {"ADA": {days[0]: 1.5, days[1]: 1.7}}
+    assert chain.price("BTC", days[0]) == 0
+    assert ("history", "BTC") in chain.unlisted, "Assets without history are remembered as unlisted"
+
+
+def test_saves_to_the_same_ticker_keep_every_day(tmp_path) -> None:
+    store = HistoryStore(tmp_path / "history")
+
+    def save_day(day: int):
+        store.save("ETH", PriceHistory(days=np.array([day]), open=np.array([float(day)]), close=np.array([float(day)])))
+
+    save_day(0)
+    assert store.lookup("ETH", [0])[0] == 0.0, "The stored history is memory-mapped before the next save"
+    save_day(1)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(save_day, range(2, 40)))
+
+    history = HistoryStore(tmp_path / "history").history("ETH")
+    assert history.days.tolist() == list(range(40)), "Concurrent saves shouldn't drop each other's days"
+    assert history.open.tolist() == [float(day) for day in range(40)]
@@ -0,0 +1,40 @@
+from pathlib import Path
+import cointracker
+import subprocess
+import sys
+import os
+
+# for `cointracker.process.execute` and everything it imports, numpy included, about 5x what it takes on a laptop so that
+# only a real regression trips it
+IMPORT_BUDGET_MS = 1000
+RUNS = 3  # the fastest fresh interpreter is timed, to ignore a busy machine
+HEADLESS_UNUSED = ("tkinter", "customtkinter", "pandas", "requests", "lxml", "yaml", "cointracker.util.parsing")
+
+
+def import_times(module: str) -> tuple[dict, set]:
+    """Imports `module` in a fresh interpreter, returning the cumulative import time of each module in ms and the
+    modules loaded.
+    """
+    env = {**os.environ, "PYTHONPATH": str(Path(cointracker.__file__).parents[1])}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys, {module}; print(' '.join(sys.modules))"],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) / 1000
+    return times, set(result.stdout.split())
+
+
+def test_execute_imports_headless_within_budget() -> None:
+    runs = [import_times("cointracker.process.execute") for _ in range(RUNS)]
+    loaded = [module for module in HEADLESS_UNUSED if module in runs[0][1]]
+    assert loaded == [], f"Processing orders shouldn't import {loaded}"
+    fastest = min(times["cointracker.process.execute"] for times, _ in runs)
+    assert fastest < IMPORT_BUDGET_MS, f"Importing took {fastest:.0f}ms, over the {IMPORT_BUDGET_MS}ms budget"
@@ -0,0 +1,205 @@
+from cointracker.util.parsing import (
+    consolidate_orders,
+    fill_missing_prices,
+    infer_missing_prices,
+    normalize_utc_dates,
+    orderbook_from_df,
+    orderbook_header,
+    split_markets,
+)
+from cointracker.objects.asset import Asset, AssetRegistry
+from cointracker.objects.enumerated_values import TransactionType
+from cointracker.objects.orderbook import Order
+import cointracker.util.parsing as parsing
+import dataclasses
+import pandas as pd
+import datetime
+
+
+def orders_df(rows: list) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=orderbook_header())
+
+
+def test_consolidate_same_day_orders() -> None:
+    day = datetime.datetime(2022, 1, 29, 10, tzinfo=datetime.timezone.utc)
+    df = orders_df(
+        [
+            [day, "ETH-USD", "BUY", 1000.0, 1.0, 1000.0, 1.0, "USD", 1000.0, 1.0, 1.0],
+            [day + datetime.timedelta(hours=5), "ETH-USD", "BUY", 1300.0, 3.0, 3900.0, 2.0, "USD", 1200.0, 1.0, 1.0],
+            [day, "ETH-USD", "SELL", 1100.0, 1.0, 1100.0, 0.0, "USD", 1100.0, 1.0, 1.0],
+            [day + datetime.timedelta(days=1), "ETH-USD", "BUY", 900.0, 1.0, 900.0, 0.0, "USD", 900.0, 1.0, 1.0],
+        ]
+    )
+    consolidated = consolidate_orders(df).drop_duplicates().reset_index(drop=True)
+
+    assert len(consolidated) == 3, "The two buys on the same day should be merged"
+    merged = consolidated.iloc[0]
+    assert merged["Date(UTC)"] == day, "The merged order keeps the first order's date"
+    assert merged["Amount"] == 4.0
+    assert merged["Fee"] == 3.0
+    assert merged["Price"] == 1225.0, "Price is the amount weighted average"
+    assert merged["Market 1 Fiat Spot Price"] == 1150.0
+    assert consolidated.iloc[1]["Type"] == "SELL", "Orders of a different type aren't merged"
+
+
+def test_normalize_utc_dates() -> None:
+    utc = datetime.timezone.utc
+    formatted = normalize_utc_dates(pd.Series(["2022-01-29 10:00:00", None]))
+    assert formatted[0] == datetime.datetime(2022, 1, 29, 10, tzinfo=utc)
+    assert pd.isna(formatted[1]), "Missing dates should become NaT"
+
+    mixed = normalize_utc_dates(pd.Series(["1/29/2022", "2022-01-29T12:00:00+02:00"]))
+    assert mixed[0] == datetime.datetime(2022, 1, 29, tzinfo=utc), "Naive dates are UTC"
+    assert mixed[1] == datetime.datetime(
+        2022, 1, 29, 10, tzinfo=utc
+    ), "Aware dates should be converted to UTC"
+
+
+def test_fill_missing_prices_one_request_per_asset(monkeypatch) -> None:
+    requests = []
+
+    def fake_prices(dates, cache=None):
+        requests.extend((asset, sorted(days)) for asset, days in dates.items())
+        base = {"ETH": 1000.0, "BNB": 300.0}
+        return {
+            asset: {day: base[asset] + day.day for day in days} for asset, days in dates.items()
+        }
+
+    monkeypatch.setattr(parsing, "getAllAssetPrices", fake_prices)
+    monkeypatch.setattr(parsing, "price_cache", lambda: None)
+    day = datetime.datetime(2022, 1, 29, 10, tzinfo=datetime.timezone.utc)
+    nan = float("nan")
+    df = orders_df(
+        [
+            [day, "ETH-USD", "BUY", 1000.0, 1.0, 1000.0, 1.0, "BNB", nan, 1.0, nan],
+            [day + datetime.timedelta(hours=5), "ETH-USD", "SELL", 1100.0, 1.0, 1100.0, 1.0, "BNB", nan, 1.0, nan],
+            [day + datetime.timedelta(days=1), "ETH-USD", "BUY", 900.0, 1.0, 900.0, 1.0, "USD", nan, 1.0, 1.0],
+            [day, "BNB-ETH", "BUY", 0.3, 1.0, 0.3, 0.0, "ETH", 250.0, nan, 2000.0],
+        ]
+    )
+    filled = fill_missing_prices(df)
+
+    assert sorted(requests) == [
+        ("BNB", [day.date()]),
+        ("ETH", [day.date(), (day + datetime.timedelta(days=1)).date()]),
+    ], "Each asset's unique days should be requested together"
+    assert filled["Market 1 Fiat Spot Price"].tolist() == [1029.0, 1029.0, 1030.0, 250.0]
+    assert filled["Market 2 Fiat Spot Price"].tolist() == [1.0, 1.0, 1.0, 1029.0]
+    assert filled["Fee Asset Fiat Spot Price"].tolist() == [329.0, 329.0, 1.0, 2000.0]
+
+
+def test_infer_missing_prices_from_fiat_legs() -> None:
+    day = datetime.datetime(2022, 1, 29, 10, tzinfo=datetime.timezone.utc)
+    nan = float("nan")
+    df = orders_df(
+        [
+            [day, "ETH-USD", "BUY", 1000.0, 1.0, 1000.0, 0.1, "BNB", nan, nan, nan],
+            [day + datetime.timedelta(hours=5), "BNB-ETH", "BUY", 0.3, 1.0, 0.3, 0.0, "ETH", nan, nan, nan],
+            [day + datetime.timedelta(days=1), "BNB-ETH", "BUY", 0.3, 1.0, 0.3, 0.0, "ETH", nan, nan, nan],
+        ]
+    )
+    filled, inferred = infer_missing_prices(df)
+
+    assert filled["Market 1 Fiat Spot Price"].tolist()[:2] == [1000.0, 300.0], "Pair legs follow from the fiat leg"
+    assert filled["Market 2 Fiat Spot Price"].tolist()[:2] == [1.0, 1000.0]
+    assert filled["Fee Asset Fiat Spot Price"].tolist()[:2] == [300.0, 1000.0], "Same day prices apply to fees"
+    assert filled.iloc[2][["Market 1 Fiat Spot Price", "Market 2 Fiat Spot Price"]].isna().all(), (
+        "Nothing is inferred for a day without a known price"
+    )
+    assert set(inferred["via"]) == {"unit", "pair", "book"}
+    assert len(inferred) == filled.iloc[:2][
+        ["Market 1 Fiat Spot Price", "Market 2 Fiat Spot Price", "Fee Asset Fiat Spot Price"]
+    ].notna().sum().sum(), "Every inferred value should be reported"
+
+
+def test_fill_missing_prices_skips_orders_without_fees(monkeypatch) -> None:
+    requested = {}
+
+    def fake_prices(dates, cache=None):
+        requested.update(dates)
+        return {asset: {day: 300.0 for day in days} for asset, days in dates.items()}
+
+    monkeypatch.setattr(parsing, "getAllAssetPrices", fake_prices)
+    monkeypatch.setattr(parsing, "price_cache", lambda: None)
+    day = datetime.datetime(2022, 1, 29, 10, tzinfo=datetime.timezone.utc)
+    nan = float("nan")
+    df = orders_df(
+        [
+            [day, "ETH-USD", "BUY", 1000.0, 1.0, 1000.0, 0.01, "BNB", 1000.0, 1.0, nan],
+            [day, "ETH-USD", "SELL", 1100.0, 1.0, 1100.0, 0.0, nan, 1100.0, 1.0, nan],
+        ]
+    )
+    filled = fill_missing_prices(df)
+
+    assert list(requested) == ["BNB"], "Orders without a fee asset shouldn't be looked up"
+    assert filled["Fee Asset Fiat Spot Price"].tolist() == [300.0, 0.0], "A missing fee asset is priced at 0"
+
+
+def test_infer_missing_prices_without_any_fees() -> None:
+    day = datetime.datetime(2022, 1, 29, 10, tzinfo=datetime.timezone.utc)
+    nan = float("nan")
+    df = orders_df(
+        [
+            [day, "ETH-USD", "BUY", 1000.0, 1.0, 1000.0, 0.0, nan, nan, nan, nan],
+            [day, "ADA-ETH", "BUY", 0.001, 1.0, 0.001, 0.0, nan, nan, nan, nan],
+        ]
+    )
+    filled, inferred = infer_missing_prices(df)
+
+    assert filled["Market 1 Fiat Spot Price"].tolist() == [1000.0, 1.0]
+    assert filled["Fee Asset Fiat Spot Price"].isna().all(), "Orders without a fee asset have nothing to infer"
+    assert "Fee Asset Fiat Spot Price" not in set(inferred["column"])
+
+
+def rowwise_orderbook(dataframe: pd.DataFrame, registry: AssetRegistry) -> list:
+    """The orders `orderbook_from_df` built one `iterrows` row at a time before it was vectorized."""
+    orders = []
+    dates = normalize_utc_dates(dataframe["Date(UTC)"])
+    for date, (_, row) in zip(dates, dataframe.iterrows()):
+        asset1, asset2 = split_markets(row["Market"], registry=registry)
+        orders.append(
+            Order(
+                date=date,
+                market_1=asset1,
+                market_2=asset2,
+                kind=TransactionType.from_str(row["Type"]),
+                price=row["Price"],
+                amount=row["Amount"],
+                fee=row["Fee"],
+                fee_asset=row["Fee Asset"],
+                spot_1_fiat=row["Market 1 Fiat Spot Price"],
+                spot_2_fiat=row["Market 2 Fiat Spot Price"],
+                fee_spot_fiat=row["Fee Asset Fiat Spot Price"],
+            )
+        )
+    return orders
+
+
+def order_fields(order: Order) -> list:
+    values = [getattr(order, field.name) for field in dataclasses.fields(order) if field.name != "id"]
+    return [(type(value), "nan") if isinstance(value, float) and value != value else (type(value), value) for value in values]
+
+
+def test_orderbook_from_df_matches_rowwise() -> None:
+    registry = AssetRegistry(
+        [
+            Asset(name="Ethereum", ticker="ETH", fungible=True, decimals=18),
+            Asset(name="Binance Coin", ticker="BNB", fungible=True, decimals=18),
+            Asset(name="US Dollar", ticker="USD", fungible=True, decimals=2),
+        ]
+    )
+    nan = float("nan")
+    df = orders_df(
+        [
+            ["2022-01-29 10:00:00", "ETH-USD", "buy", 1000, 1, 1000, 0.5, "USD", nan, 1.0, 1.0],
+            ["2022-01-30 11:30:00", "BNB-ETH", "SELL", 0.3, 2.5, 0.75, 0, nan, 300.0, nan, nan],
+            ["2022-01-31 09:15:00", "ETH-USD", "Sell", 1100.5, "2", 2201, "0.1", "BNB", 1100.5, 1, 310],
+            ["2022-02-01 00:00:00", "ETH", "BUY", nan, 0.25, nan, None, None, nan, nan, nan],
+        ]
+    )
+    vectorized = orderbook_from_df(df, registry=registry)
+    rowwise = rowwise_orderbook(df, registry=registry)
+
+    assert len(vectorized) == len(rowwise) == 4
+    for built, expected in zip(vectorized, rowwise):
+        assert order_fields(built) == order_fields(expected), f"{built} should match the row-wise order {expected}"
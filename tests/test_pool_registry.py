@@ -0,0 +1,147 @@
+import pytest
+from cointracker.objects.asset import Asset
+from cointracker.objects.pool import Pool, PoolRegistry
+from cointracker.objects.enumerated_values import OrderingStrategy, TransactionType
+from cointracker.objects.exceptions import NoMatchingPoolError
+from cointracker.objects.orderbook import Transaction
+from cointracker.process.transact import execute_sell
+import datetime
+import sys
+
+ETH = Asset(name="Ethereum", ticker="ETH", fungible=True, decimals=18)
+ADA = Asset(name="Cardano", ticker="ADA", fungible=True, decimals=6)
+
+
+def make_pool(asset: Asset, day: int, amount: float = 1.0) -> Pool:
+    return Pool(
+        asset=asset,
+        amount=amount,
+        purchase_date=datetime.datetime(2022, 1, day, tzinfo=datetime.timezone.utc),
+        purchase_cost_fiat=1000.0 * amount,
+        purchase_fee_fiat=0.0,
+    )
+
+
+def close_pool(pool: Pool, day: int) -> None:
+    pool.sale_date = datetime.datetime(2022, 2, day, tzinfo=datetime.timezone.utc)
+    pool.sale_value_fiat = 1000.0 * pool.amount
+    pool.sale_fee_fiat = 0.0
+
+
+def test_next_open_pool_ordering() -> None:
+    pools = [make_pool(ETH, 3), make_pool(ADA, 1), make_pool(ETH, 1), make_pool(ETH, 2)]
+    pool_reg = PoolRegistry(pools=pools)
+
+    assert (
+        pool_reg.next_open_pool("ETH", strategy=OrderingStrategy.FIFO) is pools[2]
+    ), "FIFO should select the earliest ETH purchase"
+    assert (
+        pool_reg.next_open_pool("eth", strategy=OrderingStrategy.LIFO) is pools[0]
+    ), "LIFO should select the latest ETH purchase"
+    assert (
+        pool_reg.next_open_pool("BTC", strategy=OrderingStrategy.FIFO) is None
+    ), "No pool should be returned for a ticker without open pools"
+
+
+def test_next_open_pool_skips_closed_and_sees_new_pools() -> None:
+    pools = [make_pool(ETH, 1), make_pool(ETH, 2)]
+    pool_reg = PoolRegistry(pools=pools)
+    assert pool_reg.next_open_pool("ETH", strategy=OrderingStrategy.FIFO) is pools[0]
+
+    close_pool(pools[0], day=1)
+    assert (
+        pool_reg.next_open_pool("ETH", strategy=OrderingStrategy.FIFO) is pools[1]
+    ), "Closed pools should drop out of the open lot index"
+
+    earlier = make_pool(ETH, 1)
+    pool_reg.pools.append(earlier)
+    assert (
+        pool_reg.next_open_pool("ETH", strategy=OrderingStrategy.FIFO) is earlier
+    ), "Pools appended to the registry should be indexed"
+
+
+def test_id_index_follows_registry_changes() -> None:
+    pools = [make_pool(ETH, 3), make_pool(ETH, 1), make_pool(ETH, 2)]
+    pool_reg = PoolRegistry(pools=pools)
+    assert pool_reg.idx_for_id(pools[2].id) == 2
+
+    pool_reg.sort(by="purchase", ascending=True)
+    assert (
+        pool_reg.idx_for_id(pools[2].id) == 1
+    ), "Sorting should move the pool purchased on day 2 to position 1"
+
+    replacement = make_pool(ADA, 5)
+    pool_reg.replace_by_id(pools[0].id, replacement)
+    assert pool_reg.get_by_id(replacement.id) is replacement
+    assert pool_reg[2] is replacement, "Replaced pools keep their position"
+
+    combined = pool_reg + make_pool(ETH, 4)
+    assert combined.get_by_id(combined[3].id) is combined[3]
+
+    with pytest.raises(ValueError):
+        pool_reg.idx_for_id(pools[0].id)  # replaced pools are no longer in the registry
+
+
+def test_append_and_extend_in_place() -> None:
+    pool_reg = PoolRegistry(pools=[make_pool(ETH, 1)])
+    pools = pool_reg.pools
+    pool_reg.append(make_pool(ETH, 2))
+    pool_reg.extend(PoolRegistry([make_pool(ADA, 3), make_pool(ETH, 4)]))
+
+    assert pool_reg.pools is pools, "Appending should not copy the pools list"
+    assert len(pool_reg) == 4
+    assert pool_reg.next_open_pool("ETH", strategy=OrderingStrategy.LIFO) is pools[3]
+    assert pool_reg.idx_for_id(pools[2].id) == 2
+
+    with pytest.raises(TypeError):
+        pool_reg.append("ETH")
+
+    combined = pool_reg + [make_pool(ETH, 5)]
+    assert len(combined) == 5 and len(pool_reg) == 4, "`+` should still return a copy"
+
+
+def test_first_unpaired_purchase_within_window() -> None:
+    pools = [make_pool(ETH, 20), make_pool(ETH, 5), make_pool(ADA, 6), make_pool(ETH, 10)]
+    pool_reg = PoolRegistry(pools=pools)
+    start = datetime.datetime(2022, 1, 6, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(days=31)
+
+    assert (
+        pool_reg.purchases.first_unpaired("ETH", start=start, end=end) is pools[3]
+    ), "The earliest ETH purchase on or after the start date should be found"
+
+    pools[3].wash.triggers_id = pools[1].id
+    assert (
+        pool_reg.purchases.first_unpaired("ETH", start=start, end=end) is pools[0]
+    ), "Purchases that already triggered a wash sale should be skipped"
+
+    pool_reg.append(make_pool(ETH, 7))
+    assert pool_reg.purchases.first_unpaired("ETH", start=start, end=end) is pool_reg[4]
+    assert (
+        pool_reg.purchases.first_unpaired("ETH", start=start, end=start) is None
+    ), "An empty window should not match"
+
+
+def test_sell_spanning_more_lots_than_the_recursion_limit() -> None:
+    lots = sys.getrecursionlimit() + 500
+    pool_reg = PoolRegistry(pools=[make_pool(ETH, 1 + i % 28, amount=0.01) for i in range(lots)])
+    sell = Transaction(
+        date=datetime.datetime(2022, 3, 1, tzinfo=datetime.timezone.utc),
+        asset=ETH,
+        kind=TransactionType.SELL,
+        amount=0.01 * (lots - 1) + 0.004,
+        asset_spot_fiat=2000.0,
+        fee=1.0,
+    )
+    sale_value = sell.amount_fiat
+    execute_sell(sell, pool_reg=pool_reg, strategy=OrderingStrategy.FIFO)
+
+    assert len(pool_reg.closed_pools) == lots, "Every lot should be sold, the last one partially"
+    assert len(pool_reg.open_pools) == 1 and pool_reg.open_pools[0].amount == pytest.approx(0.006)
+    assert sum(pool.sale_value_fiat for pool in pool_reg.closed_pools) == pytest.approx(
+        sale_value
+    ), "The sale value is split across the lots sold"
+    assert sum(pool.sale_fee_fiat for pool in pool_reg.closed_pools) == 1.0, "The fee stays with the first lot"
+
+    with pytest.raises(NoMatchingPoolError):
+        execute_sell(sell.copy(), pool_reg=pool_reg, strategy=OrderingStrategy.FIFO)
@@ -0,0 +1,43 @@
+from cointracker.objects.enumerated_values import OrderingStrategy
+from cointracker.objects.pool_table import PoolTable
+from cointracker.process.execute import execute_order, execute_washes
+import numpy as np
+
+
+def test_pool_table_matches_pool_registry(simple_wash_orderbook) -> None:
+    pool_reg = None
+    for order in simple_wash_orderbook:
+        pool_reg = execute_order(order, pools=pool_reg, strategy=OrderingStrategy.FIFO)
+    pool_reg = execute_washes(pool_reg=pool_reg)
+
+    table = PoolTable.from_pool_reg(pool_reg)
+    assert len(table) == len(pool_reg)
+    for attr in ["proceeds", "cost_basis", "disallowed_loss", "net_gain"]:
+        assert getattr(table, attr) == getattr(
+            pool_reg, attr
+        ), f"Columnar `{attr}` should match the `PoolRegistry` value"
+
+    for attr in ["closed_pools", "open_pools", "shorts", "longs", "washes", "tokens"]:
+        subset = getattr(table, attr)
+        expected = getattr(pool_reg, attr)
+        assert set(subset.id) == {
+            pool.id for pool in expected
+        }, f"Columnar `{attr}` filter should select the same pools"
+
+    assert set(table["ETH"].id) == {pool.id for pool in pool_reg["ETH"]}
+    assert len(table.by_year(2022)) == len(pool_reg.closed_pools)
+
+
+def test_pool_table_round_trip(simple_wash_orderbook) -> None:
+    pool_reg = None
+    for order in simple_wash_orderbook:
+        pool_reg = execute_order(order, pools=pool_reg, strategy=OrderingStrategy.LIFO)
+    pool_reg = execute_washes(pool_reg=pool_reg)
+
+    rebuilt = PoolTable.from_pool_reg(pool_reg).to_pool_reg()
+    for pool, rebuilt_pool in zip(pool_reg, rebuilt):
+        assert pool.id == rebuilt_pool.id
+        assert pool.purchase_date == rebuilt_pool.purchase_date
+        assert pool.sale_date == rebuilt_pool.sale_date
+        assert pool.wash == rebuilt_pool.wash
+        assert np.isclose(pool.cost_basis, rebuilt_pool.cost_basis)
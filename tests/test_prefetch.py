@@ -0,0 +1,48 @@
+from cointracker.pricing.price_cache import PriceCache
+from cointracker.pricing.providers import PriceProvider, ProviderChain
+from cointracker.util.parsing import orderbook_header
+from cointracker.util.prefetch import prefetch_prices
+import pandas as pd
+import datetime
+
+
+class CountingProvider(PriceProvider):
+    """Prices every asset at 10 except those in `down`, for which it raises a `ConnectionError`."""
+
+    name = "counting"
+
+    def __init__(self, down: set = None):
+        self.down = down or set()
+        self.calls = []
+
+    def price(self, asset: str, day: datetime.date) -> float:
+        self.calls.append((asset, day))
+        if asset in self.down:
+            raise ConnectionError(f"{asset} timed out")
+        return 10.0
+
+
+def test_prefetch_resumes_from_the_cache(tmp_path) -> None:
+    day = datetime.datetime(2022, 1, 29, 10)
+    nan = float("nan")
+    orderbook = tmp_path / "orders.xlsx"
+    pd.DataFrame(
+        [
+            [day, "ETH-USD", "BUY", 1000.0, 1.0, 1000.0, 0.0, "USD", nan, nan, nan],
+            [day + datetime.timedelta(days=1), "ADA-BTC", "BUY", 0.1, 1.0, 0.1, 0.0, "BTC", nan, nan, nan],
+            [day + datetime.timedelta(days=2), "ADA-BTC", "SELL", 0.1, 1.0, 0.1, 0.0, "BTC", nan, nan, nan],
+        ],
+        columns=orderbook_header(),
+    ).to_excel(orderbook, sheet_name="Sheet1", index=False)
+    cache = PriceCache(tmp_path / "prices.sqlite")
+
+    flaky = CountingProvider(down={"BTC"})
+    first = prefetch_prices(orderbook, cache=cache, chain=ProviderChain([flaky], breaker_threshold=10), workers=2)
+    assert first.needed == 4, "ETH's price follows from its USD leg, ADA and BTC are needed on two days each"
+    assert (first.fetched, first.unpriced) == (2, 2)
+    assert len(cache) == 2, "Prices found are cached straight away"
+
+    resumed = CountingProvider()
+    second = prefetch_prices(orderbook, cache=cache, chain=ProviderChain([resumed]), workers=2)
+    assert (second.cached, second.fetched) == (2, 2)
+    assert sorted({asset for asset, _ in resumed.calls}) == ["BTC"], "Cached days aren't fetched again"
@@ -0,0 +1,42 @@
+from cointracker.pricing.price_cache import PriceCache
+from cointracker.pricing.getAssetPrice import getAssetPrice, getAssetPrices
+import datetime
+
+
+def test_price_cache_round_trip(tmp_path) -> None:
+    cache = PriceCache(tmp_path / "prices.sqlite")
+    day = datetime.datetime(2022, 1, 29, 23, tzinfo=datetime.timezone.utc)
+    assert cache.get("ETH", day) is None
+
+    cache.set("eth", day, 2500.0, source="test")
+    assert cache.get("ETH", day.replace(hour=1)) == 2500.0, "Entries are keyed by UTC day"
+    assert cache.get("ETH", day, quote="EUR") is None, "Entries are keyed by quote currency"
+    assert cache.get("ETH", day + datetime.timedelta(hours=2)) is None
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.writes) == (1, 3, 1)
+    cache.close()
+
+    reopened = PriceCache(tmp_path / "prices.sqlite")
+    assert ("ETH", day.date()) in reopened, "Prices should persist on disk"
+    reopened.set_many([("ADA", day, 1.0), ("ETH", day - datetime.timedelta(days=3), 2400.0)])
+    assert reopened.invalidate(ticker="ETH", start=day) == 1
+    assert len(reopened) == 2
+    assert reopened.invalidate() == 2, "Invalidating without criteria clears every entry"
+
+
+def test_get_asset_price_uses_cache(tmp_path) -> None:
+    cache = PriceCache(tmp_path / "prices.sqlite")
+    day = datetime.datetime(2022, 1, 29, tzinfo=datetime.timezone.utc)
+    cache.set("ETH", day, 2500.0)
+
+    assert getAssetPrice("ETH", day, cache=cache) == 2500.0, "Cached prices skip the providers"
+    assert cache.stats.hits == 1
+
+
+def test_get_asset_prices_from_cache(tmp_path) -> None:
+    cache = PriceCache(tmp_path / "prices.sqlite")
+    day = datetime.datetime(2022, 1, 29, 15, tzinfo=datetime.timezone.utc)
+    cache.set_many([("ETH", day, 2500.0), ("ETH", day + datetime.timedelta(days=1), 2600.0)])
+
+    prices = getAssetPrices("ETH", [day, day, day + datetime.timedelta(days=1)], cache=cache)
+    assert prices == {day.date(): 2500.0, (day + datetime.timedelta(days=1)).date(): 2600.0}
+    assert getAssetPrices("USD", [day], cache=cache) == {day.date(): 1}
@@ -0,0 +1,109 @@
+from cointracker.objects.exceptions import UnlistedAssetError
+from cointracker.pricing.price_cache import PriceCache
+from cointracker.pricing.providers import PriceProvider, ProviderChain, YahooProvider
+from cointracker.pricing import getYahooPrice
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import pytest
+import datetime
+import json
+
+DAY = datetime.date(2022, 1, 29)
+
+
+class FakeProvider(PriceProvider):
+    """Prices `listed` assets at `price`, raising a `ConnectionError` instead while `down`."""
+
+    def __init__(self, name: str, listed: set, price: float = 1.0, down: bool = False):
+        self.name = name
+        self.listed = listed
+        self.value = price
+        self.down = down
+        self.calls = []
+
+    def price(self, asset: str, day: datetime.date) -> float:
+        self.calls.append((asset, day))
+        if self.down:
+            raise ConnectionError(f"{self.name} is down")
+        if asset not in self.listed:
+            raise UnlistedAssetError(f"{asset} is not listed by {self.name}")
+        return self.value
+
+
+def test_chain_falls_back_and_skips_unlisted_assets() -> None:
+    first = FakeProvider("first", listed={"ETH"}, price=2500.0)
+    second = FakeProvider("second", listed={"ETH", "RARE"}, price=3.0)
+    chain = ProviderChain([first, second], unit_priced={"USD", "USDC"})
+
+    assert chain.price("ETH", DAY) == 2500.0
+    assert chain.price("RARE", DAY) == 3.0, "The next provider is tried when one doesn't list the asset"
+    assert chain.price("RARE", DAY + datetime.timedelta(days=1)) == 3.0
+    assert first.calls.count(("RARE", DAY + datetime.timedelta(days=1))) == 0, "Unlisted assets are skipped"
+
+    assert chain.price("NFT", DAY) == 0, "Assets no provider lists are priced at 0"
+    assert chain.prices({"USDC": [DAY], "usd": [DAY]}) == {"USDC": {DAY: 1.0}, "usd": {DAY: 1.0}}
+    assert len(first.calls) + len(second.calls) == 6, "Unit priced assets shouldn't reach a provider"
+    with pytest.raises(LookupError):  # caught by a plain `except Exception` too
+        first.price("RARE", DAY)
+
+
+def test_circuit_breaker_opens_after_repeated_failures(tmp_path) -> None:
+    flaky = FakeProvider("flaky", listed={"ETH"}, down=True)
+    backup = FakeProvider("backup", listed={"ETH"}, price=2000.0)
+    cache = PriceCache(tmp_path / "prices.sqlite")
+    chain = ProviderChain([flaky, backup], cache=cache, breaker_threshold=2, breaker_reset=3600)
+
+    days = [DAY + datetime.timedelta(days=i) for i in range(5)]
+    assert chain.prices({"ETH": days}) == {"ETH": {day: 2000.0 for day in days}}
+    assert len(flaky.calls) == 2, "The provider is skipped once its breaker opens"
+    assert chain.breakers["flaky"].is_open
+
+    assert chain.price("ETH", days[0]) == 2000.0
+    assert len(backup.calls) == 5, "Prices found are cached"
+
+
+class ChartHandler(BaseHTTPRequestHandler):
+    """Stands in for Yahoo's chart API: three days of BTC-USD, 404 for any other symbol."""
+
+    def do_GET(self):
+        if self.path.startswith("/BTC-USD?"):
+            start = int(datetime.datetime(2022, 1, 28, tzinfo=datetime.timezone.utc).timestamp())
+            chart = {
+                "chart": {
+                    "result": [
+                        {
+                            "timestamp": [start + i * 86400 for i in range(3)],
+                            "indicators": {"quote": [{"open": [37000.0, None, 38000.0]}]},
+                        }
+                    ],
+                    "error": None,
+                }
+            }
+            self.send_response(200)
+            body = json.dumps(chart).encode()
+        else:
+            self.send_response(404)
+            body = b'{"chart": {"result": null, "error": {"code": "Not Found"}}}'
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_yahoo_chart_mode_caches_every_day(tmp_path, monkeypatch) -> None:
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ChartHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(getYahooPrice, "CHART_URL", f"http://127.0.0.1:{httpd.server_address[1]}/")
+    cache = PriceCache(tmp_path / "prices.sqlite")
+    chain = ProviderChain([YahooProvider(mode="chart")], cache=cache)
+    try:
+        assert chain.price("BTC", datetime.date(2022, 1, 28)) == 37000.0
+        assert cache.get("BTC", datetime.date(2022, 1, 30)) == 38000.0, "Every day returned is cached"
+        assert cache.get("BTC", datetime.date(2022, 1, 29)) is None, "Days without an open are skipped"
+        assert chain.price("NOPE", DAY) == 0
+        assert ("yahoo", "NOPE") in chain.unlisted, "A 404 means Yahoo doesn't list the symbol"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()